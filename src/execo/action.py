@@ -268,7 +268,7 @@ class Action(object):
         refer to `execo.process.ProcessBase.ok` for detailed semantics
         of being ok for a process.
         """
-        return all([process.ok for process in self.processes])
+        return all(process.ok for process in self.processes)
 
     @property
     def finished_ok(self):
@@ -460,6 +460,11 @@ def filter_bad_hosts(action, hosts):
 
 class ActionNotificationProcessLH(ProcessLifecycleHandler):
 
+    # a single instance is shared by all processes of an action. No
+    # locking is needed for the terminated processes counter: process
+    # lifecycle handlers are always called from the conductor thread,
+    # so calls to end() are already serialized.
+
     def __init__(self, action, total_processes):
         super(ActionNotificationProcessLH, self).__init__()
         self.action = action
@@ -307,6 +307,10 @@ class _Conductor(object):
         self.__io_thread.start()
         return self
 
+    def in_conductor_thread(self):
+        """Return True if called from the conductor thread."""
+        return threading.current_thread() is self.__io_thread
+
     def terminate(self):
         """Close the conductor thread."""
         # the closing of the pipe will wake the conductor which will
@@ -52,6 +52,7 @@ configuration = {
     'fileput_tool': SCP,
     'fileget_tool': SCP,
     'compact_output_threshold': 4096,
+    'max_inmem_output': 0,
     'kill_timeout': 60,
     'intr_period': 1,
     'port_range': (25500, 26700),
@@ -98,6 +99,11 @@ configuration = {
   stderr are displayed by `execo.process.ProcessBase.dump` when their
   size is greater than this threshold. 0 for no threshold
 
+- ``max_inmem_output``: when the stdout or stderr of a process
+  accumulated by its default handler grows beyond this size (in
+  characters), it is moved to a temporary file instead of being kept
+  in memory. 0 for no limit
+
 - ``kill_timeout``: number of seconds to wait after a clean SIGTERM
   kill before assuming that the process is not responsive and killing
   it with SIGKILL
@@ -222,8 +228,10 @@ default_connection_params = make_default_connection_params()
   addresses. Takes a host address, returns a host address.
 """
 
+_builtin_connection_params = make_default_connection_params()
+
 def make_connection_params(connection_params = None, default_params = None):
-    return_params = make_default_connection_params()
+    return_params = dict(_builtin_connection_params)
     if default_params == None:
         default_params = default_connection_params
     return_params.update(default_params)
@@ -29,13 +29,31 @@ from traceback import format_exc
 from .report import Report
 from .exception import ProcessesFailed
 import errno, os, re, shlex, signal, subprocess
-import threading, time, pipes, sys
+import tempfile, threading, time, pipes, sys
 
 if sys.version_info >= (3,):
     import codecs, locale
     _decode = lambda s: codecs.decode(s, locale.getpreferredencoding())
+    # no newline translation, and an encoding able to store any
+    # string, so that output read back is exactly what was written
+    _output_tempfile = lambda: tempfile.TemporaryFile(mode = "w+", encoding = "utf-8",
+                                                      errors = "surrogatepass", newline = "")
 else:
     _decode = lambda s: s
+    _output_tempfile = lambda: tempfile.TemporaryFile(mode = "w+")
+
+def _set_conductor_pgrp():
+    # run in the child before exec: put it in the conductor's
+    # process group
+    os.setpgid(0, the_conductor.pgrp)
+
+if sys.version_info >= (3, 11):
+    # subprocess can set the process group itself, without a
+    # preexec_fn, which would prevent it from using vfork /
+    # posix_spawn
+    _popen_pgrp_kwargs = { 'process_group': the_conductor.pgrp }
+else:
+    _popen_pgrp_kwargs = { 'preexec_fn': _set_conductor_pgrp }
 
 STDOUT = 1
 """Identifier for the stdout stream"""
@@ -67,6 +85,9 @@ class ProcessLifecycleHandler(object):
         """
         pass
 
+def _has_line_break(s):
+    return len(s) > 0 and s.splitlines() != [ s ]
+
 class ProcessOutputHandler(object):
 
     """Abstract handler for `execo.process.ProcessBase` output."""
@@ -92,15 +113,23 @@ class ProcessOutputHandler(object):
         """
         k = (process, stream)
         if not k in self._buffer:
-            self._buffer[k] = ""
-        self._buffer[k] += string
-        lines = self._buffer[k].splitlines(True)
-        if len(lines) >= 2:
-            for line in lines[:-1]:
-                self.read_line(process, stream, line, False, False)
-            self._buffer[k] = lines[-1]
+            self._buffer[k] = []
+        fragments = self._buffer[k]
+        fragments.append(string)
+        # the buffered data is only joined and split in lines when the
+        # incoming string, or the previous buffered line (which may
+        # end with \r, to be followed by \n), contains a line break,
+        # so that long lines received in many chunks are not rescanned
+        # for each chunk
+        if (_has_line_break(string)
+            or (len(fragments) >= 2 and _has_line_break(fragments[-2][-1:]))):
+            lines = "".join(fragments).splitlines(True)
+            if len(lines) >= 2:
+                for line in lines[:-1]:
+                    self.read_line(process, stream, line, False, False)
+            fragments[:] = lines[-1:]
         if eof or error:
-            self.read_line(process, stream, self._buffer[k], eof, error)
+            self.read_line(process, stream, "".join(fragments), eof, error)
             del self._buffer[k]
 
     def read_line(self, process, stream, string, eof, error):
@@ -140,10 +169,11 @@ def handle_process_output(process, stream, handler, string, eof, error):
     :param error: boolean, whether the output stream is in error
 
     """
-    if isinstance(handler, int):
-        os.write(handler, string)
-    elif isinstance(handler, ProcessOutputHandler):
+    # most frequent case first
+    if isinstance(handler, ProcessOutputHandler):
         handler.read(process, stream, string, eof, error)
+    elif isinstance(handler, int):
+        os.write(handler, string)
     elif hasattr(handler, "write"):
         handler.write(string)
     elif is_string(handler):
@@ -155,6 +185,49 @@ def handle_process_output(process, stream, handler, string, eof, error):
             process._out_files[k].close()
             del process._out_files[k]
 
+class _output_buffer(object):
+
+    # accumulates the output of a process stream (the default stdout
+    # / stderr handlers). Output is accumulated as a list of chunks,
+    # to avoid copying the whole output on each read from the
+    # stream. The chunks are joined (and collapsed into a single
+    # chunk) only when the output is accessed. If the accumulated
+    # output grows beyond configuration['max_inmem_output'], it is
+    # moved to a temporary file, and further output is appended to
+    # this file.
+
+    def __init__(self, value = None):
+        self._lock = threading.Lock()
+        self._chunks = [ value ] if value else []
+        self._size = len(value) if value else 0
+        self._file = None
+
+    def append(self, s):
+        with self._lock:
+            if self._file:
+                self._file.write(s)
+                return
+            self._chunks.append(s)
+            self._size += len(s)
+            thresh = configuration.get('max_inmem_output')
+            if thresh and self._size > thresh:
+                self._file = _output_tempfile()
+                self._file.write("".join(self._chunks))
+                self._chunks = []
+
+    def get(self):
+        with self._lock:
+            if self._file:
+                self._file.seek(0)
+                s = self._file.read()
+                self._file.seek(0, os.SEEK_END)
+                return s
+            if len(self._chunks) == 0:
+                return ""
+            if len(self._chunks) > 1:
+                self._chunks = [ "".join(self._chunks) ]
+            return self._chunks[0]
+
 class _debugio_output_handler(ProcessOutputHandler):
 
     def read_line(self, process, stream, string, eof, error):
@@ -447,10 +520,8 @@ class ProcessBase(object):
         or stream eof or error before finding any match)."""
         self.write_error = False
         """Whether there was a write error to the process stdin."""
-        self.stdout = ""
-        """Process stdout"""
-        self.stderr = ""
-        """Process stderr"""
+        self._stdout = _output_buffer()
+        self._stderr = _output_buffer()
         self.ignore_exit_code = ignore_exit_code
         """Boolean. If True, a process with a return code != 0 will still be
         considered ok"""
@@ -552,8 +623,8 @@ class ProcessBase(object):
         self.forced_kill = False
         self.expect_fail = False
         self.write_error = False
-        self.stdout = ""
-        self.stderr = ""
+        self._stdout = _output_buffer()
+        self._stderr = _output_buffer()
         self.stdout_ioerror = False
         self.stderr_ioerror = False
         self._thread_local_storage.expect_handler = None
@@ -638,11 +709,34 @@ class ProcessBase(object):
         with self._lock:
             return "%s\n" % (str(self),)+ style.emph("stdout:") + "\n%s\n" % (compact_output(self.stdout),) + style.emph("stderr:") + "\n%s" % (compact_output(self.stderr),)
 
+    @property
+    def stdout(self):
+        """Process stdout"""
+        return self._stdout.get()
+
+    @stdout.setter
+    def stdout(self, value):
+        self._stdout = _output_buffer(value)
+
+    @property
+    def stderr(self):
+        """Process stderr"""
+        return self._stderr.get()
+
+    @stderr.setter
+    def stderr(self, value):
+        self._stderr = _output_buffer(value)
+
+    # running, ok and finished_ok are read without taking the lock:
+    # they only read attributes, and all the attributes describing a
+    # process' end (error, exit_code, timeouted, ...) are set before
+    # ended is set to True, so a process seen as ended is always
+    # seen with its final state.
+
     @property
     def running(self):
         """If the process is currently running."""
-        with self._lock:
-            return self.started and not self.ended
+        return self.started and not self.ended
 
     def _handle_stdout(self, buf, eof, error):
         """Handle stdout activity.
@@ -657,15 +751,16 @@ class ProcessBase(object):
         if logger.getEffectiveLevel() <= IODEBUG:
             _debugio_handler.read(self, STDOUT, buf, eof, error)
         if self.default_stdout_handler:
-            self.stdout += buf
+            self._stdout.append(buf)
         if error == True:
             self.stdout_ioerror = True
-        for handler in list(self.stdout_handlers):
-            try:
-                handle_process_output(self, STDOUT, handler, buf, eof, error)
-            except Exception as e:
-                logger.error("process stdout handler %s raised exception for process %s:\n%s" % (
-                        handler, self, format_exc()))
+        if self.stdout_handlers:
+            for handler in list(self.stdout_handlers):
+                try:
+                    handle_process_output(self, STDOUT, handler, buf, eof, error)
+                except Exception as e:
+                    logger.error("process stdout handler %s raised exception for process %s:\n%s" % (
+                            handler, self, format_exc()))
 
     def _handle_stderr(self, buf, eof, error):
         """Handle stderr activity.
@@ -680,15 +775,16 @@ class ProcessBase(object):
         if logger.getEffectiveLevel() <= IODEBUG:
             _debugio_handler.read(self, STDERR, buf, eof, error)
         if self.default_stderr_handler:
-            self.stderr += buf
+            self._stderr.append(buf)
         if error == True:
             self.stderr_ioerror = True
-        for handler in list(self.stderr_handlers):
-            try:
-                handle_process_output(self, STDERR, handler, buf, eof, error)
-            except Exception as e:
-                logger.error("process stderr handler %s raised exception for process %s:\n%s" % (
-                        handler, self, format_exc()))
+        if self.stderr_handlers:
+            for handler in list(self.stderr_handlers):
+                try:
+                    handle_process_output(self, STDERR, handler, buf, eof, error)
+                except Exception as e:
+                    logger.error("process stderr handler %s raised exception for process %s:\n%s" % (
+                            handler, self, format_exc()))
 
     @property
     def ok(self):
@@ -712,14 +808,13 @@ class ProcessBase(object):
           - returned 0 (or was instructed to ignore a non zero exit
             code)
         """
-        with self._lock:
-            if self.expect_fail and (not self.ignore_expect_fail): return False
-            if self.write_error and (not self.ignore_write_error): return False
-            if not self.started: return True
-            if self.started and not self.ended: return True
-            return ((not self.error or self.ignore_error)
-                    and (not self.timeouted or self.ignore_timeout)
-                    and (self.exit_code == 0 or self.ignore_exit_code or self.killed))
+        if self.expect_fail and (not self.ignore_expect_fail): return False
+        if self.write_error and (not self.ignore_write_error): return False
+        if not self.started: return True
+        if self.started and not self.ended: return True
+        return ((not self.error or self.ignore_error)
+                and (not self.timeouted or self.ignore_timeout)
+                and (self.exit_code == 0 or self.ignore_exit_code or self.killed))
 
     @property
     def finished_ok(self):
@@ -728,8 +823,7 @@ class ProcessBase(object):
         A process is finished_ok if it has started and ended and
         it is ok.
         """
-        with self._lock:
-            return self.started and self.ended and self.ok
+        return self.started and self.ended and self.ok
 
     def _log_terminated(self):
         """To be called (in subclasses) when a process terminates.
@@ -737,10 +831,10 @@ class ProcessBase(object):
         This method will log process termination as needed.
         """
         with self._lock:
-            s = style.emph("terminated:") + " " + self.dump()
             warn = ((self.error and not self.nolog_error)
                     or (self.timeouted and not self.nolog_timeout)
                     or (self.exit_code != 0 and not (self.nolog_exit_code or self.killed)))
+            s = style.emph("terminated:") + " " + self.dump()
         # actual logging outside the lock to avoid deadlock between process lock and logging lock
         if warn:
             logger.warning(s)
@@ -759,7 +853,7 @@ class ProcessBase(object):
         If it is running, this method will first kill it then wait for
         its termination before reseting;
         """
-        logger.debug(style.emph("reset:") + " %s" % (str(self),))
+        logger.debug(style.emph("reset:") + " %s", self)
         if self.started and not self.ended:
             self.kill()
             self.wait()
@@ -892,11 +986,31 @@ class ProcessBase(object):
             self._notify_expect_fail(regexes)
         return (re_index_and_match_object[0], re_index_and_match_object[1])
 
+# linux >= 3.5 (with CONFIG_PROC_CHILDREN) lists the children of each
+# task in /proc, which avoids forking a ps for each process of the
+# tree. Elsewhere, fallback to ps.
+_proc_childs_available = os.path.exists("/proc/%i/task/%i/children" % (os.getpid(), os.getpid()))
+_ps_pid_re = re.compile("^\s*(\d+)\s+", re.MULTILINE)
+
+def _get_direct_childs(pid):
+    if _proc_childs_available:
+        childs = []
+        try:
+            for tid in os.listdir("/proc/%i/task" % (pid,)):
+                with open("/proc/%i/task/%s/children" % (pid, tid)) as f:
+                    childs.extend([ int(c) for c in f.read().split() ])
+        except (IOError, OSError):
+            # process or task vanished
+            pass
+        return childs
+    else:
+        s = subprocess.Popen(("ps", "--ppid", str(pid)), stdout=subprocess.PIPE, universal_newlines=True).communicate()[0]
+        return [ int(c) for c in _ps_pid_re.findall(s) ]
+
 def _get_childs(pid):
     childs = []
     try:
-        s = subprocess.Popen(("ps", "--ppid", str(pid)), stdout=subprocess.PIPE, universal_newlines=True).communicate()[0]
-        tmp_childs = [ int(c) for c in re.findall("^\s*(\d+)\s+", s, re.MULTILINE) ]
+        tmp_childs = _get_direct_childs(pid)
         childs.extend(tmp_childs)
         for child in tmp_childs:
             childs.extend(_get_childs(child))
@@ -978,6 +1092,7 @@ class Process(ProcessBase):
         self._ptymaster = None
         self._ptyslave = None
         self.__start_pending = False
+        self.__end_notified = False
         self.stdout_fd = None
         """the subprocess stdout filehandle or None if not available."""
         self.stderr_fd = None
@@ -1014,6 +1129,7 @@ class Process(ProcessBase):
         self._force_kill_timeout_date = None
         self._ptymaster = None
         self._ptyslave = None
+        self.__end_notified = False
         self.stdout_fd = None
         self.stderr_fd = None
         self.stdin_fd = None
@@ -1042,7 +1158,7 @@ class Process(ProcessBase):
             if self.started or self.ended or self.__start_pending:
                 return self
             self.__start_pending = True
-        logger.debug("enqueue start of " + str(self))
+        logger.debug("enqueue start of %s", self)
         the_conductor.start_process(self)
         return self
 
@@ -1055,7 +1171,7 @@ class Process(ProcessBase):
             self.start_date = time.time()
             if self.timeout != None:
                 self.timeout_date = self.start_date + self.timeout
-        logger.debug(style.emph("start: ") + str(self))
+        logger.debug(style.emph("start: ") + "%s", self)
         start_error = False
         try:
             if self.pty:
@@ -1066,7 +1182,7 @@ class Process(ProcessBase):
                                                 stderr = subprocess.PIPE,
                                                 close_fds = True,
                                                 shell = self.shell,
-                                                preexec_fn = lambda: os.setpgid(0, the_conductor.pgrp))
+                                                **_popen_pgrp_kwargs)
                 self.stdout_fd = self._ptymaster
                 self.stderr_fd = self.process.stderr.fileno()
                 self.stdin_fd = self._ptymaster
@@ -1077,7 +1193,7 @@ class Process(ProcessBase):
                                                 stderr = subprocess.PIPE,
                                                 close_fds = True,
                                                 shell = self.shell,
-                                                preexec_fn = lambda: os.setpgid(0, the_conductor.pgrp))
+                                                **_popen_pgrp_kwargs)
                 self.stdout_fd = self.process.stdout.fileno()
                 self.stderr_fd = self.process.stderr.fileno()
                 self.stdin_fd = self.process.stdin.fileno()
@@ -1095,7 +1211,6 @@ class Process(ProcessBase):
                 self.error_reason = e
                 self.ended = True
                 self.end_date = time.time()
-                self.ended_condition.notify_all()
             self.ended_event.set()
         for handler in list(self.lifecycle_handlers):
             try:
@@ -1104,6 +1219,13 @@ class Process(ProcessBase):
                 logger.error("process lifecycle handler %s start raised exception for process %s:\n%s" % (
                         handler, self, format_exc()))
         if self.error:
+            self._notify_end()
+
+    def _notify_end(self):
+        # log termination and run lifecycle end handlers, then notify
+        # waiters, so that wait() returns after them, even if logging
+        # raises
+        try:
             self._log_terminated()
             for handler in list(self.lifecycle_handlers):
                 try:
@@ -1111,6 +1233,10 @@ class Process(ProcessBase):
                 except Exception as e:
                     logger.error("process lifecycle handler %s end raised exception for process %s:\n%s" % (
                         handler, self, format_exc()))
+        finally:
+            with self._lock:
+                self.__end_notified = True
+                self.ended_condition.notify_all()
 
     def kill(self, sig = signal.SIGTERM, auto_force_kill_timeout = True):
         """Send a signal (default: SIGTERM) to the subprocess.
@@ -1129,7 +1255,7 @@ class Process(ProcessBase):
         Sending signals to processes automatically ignores and disable
         logs of exit code != 0.
         """
-        logger.debug(style.emph("kill with signal %s:" % sig) + " %s" % (str(self),))
+        logger.debug(style.emph("kill with signal %s:" % sig) + " %s", self)
         with self._lock:
             while self.__start_pending:
                 non_retrying_intr_cond_wait(self.started_condition)
@@ -1215,7 +1341,7 @@ class Process(ProcessBase):
         Update its exit_code, end_date, ended flag, and log its
         termination (INFO or WARNING depending on how it ended).
         """
-        logger.debug("set terminated %s, exit_code=%s" % (str(self), exit_code))
+        logger.debug("set terminated %s, exit_code=%s", self, exit_code)
         with self._lock:
             # careful placement of locked sections to avoid deadlock
             # between process lock and logging lock, and to allow
@@ -1246,33 +1372,34 @@ class Process(ProcessBase):
             for h in self._out_files:
                 self._out_files[h].close()
                 del self._out_files[h]
-            self.ended_condition.notify_all()
         self.ended_event.set()
-        self._log_terminated()
-        for handler in list(self.lifecycle_handlers):
-            try:
-                handler.end(self)
-            except Exception as e:
-                logger.error("process lifecycle handler %s end raised exception for process %s:\n%s" % (
-                        handler, self, format_exc()))
+        self._notify_end()
 
     def wait(self, timeout = None):
         """Wait for the subprocess end."""
-        logger.debug(style.emph("wait: ") + " %s" % (str(self),))
+        logger.debug(style.emph("wait: ") + " %s", self)
         with self._lock:
             while self.__start_pending:
                 non_retrying_intr_cond_wait(self.started_condition)
             if not self.started:
                 raise ValueError("Trying to wait a process which has not been started")
-        timeout = get_seconds(timeout)
-        if timeout != None:
-            end = time.time() + timeout
-        while self.ended != True and (timeout == None or timeout > 0):
-            with the_conductor.lock:
-                non_retrying_intr_cond_wait(the_conductor.condition, timeout)
+            timeout = get_seconds(timeout)
             if timeout != None:
-                timeout = end - time.time()
-        logger.debug(style.emph("wait finished:") + " %s" % (str(self),))
+                end = time.time() + timeout
+            # wait on this process' own condition, notified only when
+            # it has ended and its lifecycle handlers have run, rather
+            # than on the conductor condition, which is notified at
+            # each conductor loop iteration. From the conductor thread
+            # (eg. in a lifecycle end handler), the end notification
+            # would never come, so only wait for the ended flag
+            in_conductor_thread = the_conductor.in_conductor_thread()
+            while (not self.__end_notified
+                   and not (in_conductor_thread and self.ended)
+                   and (timeout == None or timeout > 0)):
+                non_retrying_intr_cond_wait(self.ended_condition, timeout)
+                if timeout != None:
+                    timeout = end - time.time()
+        logger.debug(style.emph("wait finished:") + " %s", self)
         return self
 
     def run(self, timeout = None):
@@ -1331,16 +1458,18 @@ class SshProcess(Process):
         """The command executed remotely"""
         self.connection_params = connection_params
         """Remote connection params"""
+        actual_connection_params = make_connection_params(connection_params)
+        if is_string(cmd):
+            cmd_args = (cmd,)
+        else:
+            cmd_args = tuple(cmd)
         real_cmd = (get_ssh_command(host.user,
                                     host.keyfile,
                                     host.port,
-                                    connection_params)
-                    + (get_rewritten_host_address(host.address, connection_params),))
-        if not is_string(cmd):
-            real_cmd += cmd
-        else:
-            real_cmd += (cmd,)
-        kwargs.update({"pty": make_connection_params(connection_params).get('pty')})
+                                    actual_connection_params)
+                    + (get_rewritten_host_address(host.address, actual_connection_params),)
+                    + cmd_args)
+        kwargs.update({"pty": actual_connection_params.get('pty')})
         """For ssh processes, pty is initialized by the connection params. This
         allows setting default pty behaviors in connection_params shared
         by various remote processes (this was motivated by allowing
@@ -1367,6 +1496,8 @@ class SshProcess(Process):
 def _escape_taktuk_cmd_args(s):
     # [ ] are used as taktuk argument delimiter
     # ! is used as taktuk escape character
+    if '!' not in s and ']' not in s:
+        return s
     s = s.replace('!', '!!')
     s = s.replace(']', '!]')
     return s
@@ -1403,7 +1534,7 @@ class TaktukProcess(ProcessBase): #IGNORE:W0223
                 self.timeout_date = self.start_date + self.timeout
             self.started_condition.notify_all()
         self.started_event.set()
-        logger.debug(style.emph("start:") + " %s" % (str(self),))
+        logger.debug(style.emph("start:") + " %s", self)
         for handler in list(self.lifecycle_handlers):
             try:
                 handler.start(self)
@@ -1422,7 +1553,7 @@ class TaktukProcess(ProcessBase): #IGNORE:W0223
         """
         # careful placement of locked sections to allow calling
         # lifecycle handlers outside the lock
-        logger.debug("set terminated %s, exit_code=%s, error=%s" % (str(self), exit_code, error))
+        logger.debug("set terminated %s, exit_code=%s, error=%s", self, exit_code, error)
         with self._lock:
             if not self.started:
                 self.start()
@@ -1470,13 +1601,12 @@ class port_forwarder_stderr_handler(ProcessOutputHandler):
 
     def __init__(self, local_port, bind_address):
         super(port_forwarder_stderr_handler, self).__init__()
-        regex = "^debug1: Local forwarding listening on %s port %i\.\s*$" % (
+        self.pf_open_line = "debug1: Local forwarding listening on %s port %i." % (
             bind_address,
             local_port)
-        self.pf_open_re = re.compile(regex)
 
     def read_line(self, process, stream, string, eof, error):
-        if self.pf_open_re.match(string):
+        if string.rstrip() == self.pf_open_line:
             process.forwarding.set()
 
 class PortForwarder(SshProcess):
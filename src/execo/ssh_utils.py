@@ -40,8 +40,13 @@ def get_ssh_scp_auth_options(user = None, keyfile = None, port = None, connectio
       `execo.config.default_connection_params`, whose values will
       override those in `execo.config.default_connection_params`
     """
+    return _get_ssh_scp_auth_options(user, keyfile, port,
+                                     make_connection_params(connection_params))
+
+def _get_ssh_scp_auth_options(user, keyfile, port, actual_connection_params):
+    # same as get_ssh_scp_auth_options, but actual_connection_params
+    # must already be the result of make_connection_params
     ssh_scp_auth_options = ()
-    actual_connection_params = make_connection_params(connection_params)
 
     if user != None:
         ssh_scp_auth_options += ("-o", "User=%s" % (user,))
@@ -95,7 +100,7 @@ def _get_connector_command(connector_params_entry,
     actual_connection_params = make_connection_params(connection_params)
     command += (actual_connection_params[connector_params_entry],)
     command += actual_connection_params[connector_options_params_entry]
-    command += get_ssh_scp_auth_options(user, keyfile, port, connection_params)
+    command += _get_ssh_scp_auth_options(user, keyfile, port, actual_connection_params)
     return command
 
 def get_ssh_command(user = None, keyfile = None, port = None, connection_params = None):
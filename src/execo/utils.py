@@ -20,7 +20,7 @@ from .config import configuration
 import pipes, subprocess, os, time, sys, traceback, re, functools, threading, random
 
 def comma_join(*args):
-    return ", ".join([ arg for arg in args if len(arg) > 0 ])
+    return ", ".join(filter(None, args))
 
 def compact_output(s):
     thresh = configuration.get('compact_output_threshold')
@@ -49,7 +49,18 @@ class HashableDict(dict):
         return tuple((k,self[k]) for k in sorted(self))
 
     def __hash__(self):
-        return hash(self.__key())
+        # cached, as the dict must not be mutated after its first use
+        # as a key
+        try:
+            return self.__hash
+        except AttributeError:
+            self.__hash = hash(self.__key())
+            return self.__hash
+
+    def __getstate__(self):
+        # don't pickle the cached hash: the hash of strings may differ
+        # between python processes
+        return {}
 
 def sweep(parameters):
 
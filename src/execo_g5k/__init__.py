@@ -22,8 +22,8 @@ from .config import g5k_configuration, \
     default_frontend_connection_params, default_oarsh_oarcp_params
 
 from .oar import OarSubmission, oarsub, oardel, get_current_oar_jobs, \
-    get_oar_job_info, wait_oar_job_start, get_oar_job_nodes, \
-    get_oar_job_subnets, get_oar_job_kavlan, oarsubgrid
+    get_oar_job_info, get_oar_jobs_infos, wait_oar_job_start, \
+    get_oar_job_nodes, get_oar_job_subnets, get_oar_job_kavlan, oarsubgrid
 
 from .oargrid import oargridsub, oargriddel, \
     get_current_oargrid_jobs, get_oargrid_job_info, \
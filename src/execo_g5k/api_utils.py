@@ -181,17 +181,18 @@ class APIConnection(object):
         if self.username and not self.password:
             self.password = _get_api_password(self.username, self.base_uri)
         self.timeout = timeout
+        self._thread_local_storage = threading.local()
 
     def get(self, relative_uri):
         """Get the (response, content) tuple for the given path on the server"""
         uri = self._build_uri(relative_uri)
         auth, verify = self._get_security_conf()
-        response = requests.get(uri,
-                                params=self.additional_args,
-                                headers=self.headers,
-                                auth=auth,
-                                verify=verify,
-                                timeout=self.timeout)
+        response = self._get_session().get(uri,
+                                           params=self.additional_args,
+                                           headers=self.headers,
+                                           auth=auth,
+                                           verify=verify,
+                                           timeout=self.timeout)
         if response.status_code not in [200, 304]:
             raise APIException(uri, 'GET', response)
         return response
@@ -200,17 +201,27 @@ class APIConnection(object):
         """Submit the body to a given path on the server, returns the (response, content) tuple"""
         uri = self._build_uri(relative_uri)
         auth, verify = self._get_security_conf()
-        response = requests.post(uri,
-                                 params=self.additional_args,
-                                 headers=self.headers,
-                                 json=json,
-                                 auth=auth,
-                                 verify=verify,
-                                 timeout=self.timeout)
+        response = self._get_session().post(uri,
+                                            params=self.additional_args,
+                                            headers=self.headers,
+                                            json=json,
+                                            auth=auth,
+                                            verify=verify,
+                                            timeout=self.timeout)
         if response.status_code not in [200, 304]:
             raise APIException(uri, 'POST', response)
         return response
 
+    def _get_session(self):
+        # one requests session per thread, so that http connections
+        # are kept alive and reused between requests, without sharing
+        # a session (which is not thread-safe) between threads
+        session = getattr(self._thread_local_storage, 'session', None)
+        if session == None:
+            session = requests.Session()
+            self._thread_local_storage.session = session
+        return session
+
     def _build_uri(self, relative_uri):
         uri = self.base_uri + "/" + relative_uri.lstrip("/")
         return uri
@@ -473,9 +484,9 @@ def get_site_network_equipments(site):
 
 def get_cluster_hosts(cluster):
     """Get the list of hosts from a cluster. Returns an iterable."""
-    for site in get_g5k_sites():
-        if cluster in get_site_clusters(site, queues = None):
-            return get_api_data()['hierarchy'][site][cluster]
+    for site_clusters in get_api_data()['hierarchy'].values():
+        if cluster in site_clusters:
+            return site_clusters[cluster]
     raise ValueError("unknown g5k cluster %s" % (cluster,))
 
 def get_cluster_network_equipments(cluster):
@@ -506,8 +517,8 @@ def get_g5k_hosts(queues = "default"):
 
 def get_cluster_site(cluster):
     """Get the site of a cluster."""
-    for site in get_g5k_sites():
-        if cluster in get_site_clusters(site, queues = None):
+    for site, site_clusters in get_api_data()['hierarchy'].items():
+        if cluster in site_clusters:
             return site
     raise ValueError("unknown g5k cluster %s" % (cluster,))
 
@@ -710,6 +721,6 @@ def set_nodes_vlan(site, hosts, interface, vlan_id):
         splitted[0] = splitted[0] + "-" + interface
         return ".".join(splitted)
 
-    network_addresses = map(_to_network_address, hosts)
+    network_addresses = [ _to_network_address(host) for host in hosts ]
     logger.info("Setting %s in vlan %s of site %s" % (network_addresses, vlan_id, site))
     return _get_g5k_api().post('/sites/%s/vlans/%s' % (site, str(vlan_id)), {"nodes": network_addresses})
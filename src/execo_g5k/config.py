@@ -16,7 +16,10 @@
 # You should have received a copy of the GNU General Public License
 # along with Execo.  If not, see <http://www.gnu.org/licenses/>
 
-from execo.config import load_configuration, get_user_config_filename
+from execo.config import load_configuration, get_user_config_filename, \
+    default_connection_params
+from execo.log import logger
+import errno, os
 
 # _STARTOF_ g5k_configuration
 g5k_configuration = {
@@ -29,6 +32,8 @@ g5k_configuration = {
     'no_ssh_for_local_frontend' : False,
     'polling_interval' : 20,
     'tiny_polling_interval' : 10,
+    'oar_info_cache_ttl' : 0,
+    'ssh_multiplex' : True,
     'default_frontend' : None,
     'api_uri': "https://api.grid5000.fr/3.0/",
     'api_username': None,
@@ -76,6 +81,24 @@ g5k_configuration = {
   and start date of the job is over but the job is not yet in running
   state.
 
+- ``oar_info_cache_ttl``: time in seconds during which the results of
+  `execo_g5k.oar.get_oar_job_info` and
+  `execo_g5k.oargrid.get_oargrid_job_info` are cached, to avoid
+  querying again the frontends for the same job. 0 (the default)
+  disables the cache.
+
+- ``ssh_multiplex``: if True, ssh, scp and taktuk connections to
+  frontends share a single ssh connection per frontend (ssh options
+  ControlMaster, ControlPath, ControlPersist, which need OpenSSH >=
+  5.6), kept open in the background for 10 minutes after its last
+  use. The control sockets are created in directory ``~/.execo/``.
+  Set it to False for older OpenSSH, or if ``~/.execo/`` is on a
+  shared filesystem. Must be set in ``~/.execo.conf.py`` as it is
+  used when building `default_frontend_connection_params`. To do so,
+  ``~/.execo.conf.py`` is executed twice when importing
+  `execo_g5k`: first to load `g5k_configuration`, then to load the
+  connection params dicts.
+
 - ``default_frontend``: address of default frontend.
 
 - ``api_uri``: base uri for g5k api serverr.
@@ -116,22 +139,54 @@ default_oarsh_oarcp_params = make_default_oarsh_oarcp_params()
 See `execo.config.make_default_connection_params`
 """
 
+def _make_control_path_dir():
+    # create the directory of the ssh multiplexing control
+    # sockets. Return False if it cannot be created
+    try:
+        os.makedirs(os.path.expanduser("~/.execo"), 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            logger.warning("unable to create ~/.execo (%s), ssh multiplexing to frontends disabled" % (e,))
+            return False
+    return True
+
 def make_default_frontend_connection_params():
 # _STARTOF_ default_frontend_connection_params
     default_frontend_connection_params = {
         'pty': True,
         'host_rewrite_func': lambda host: host + ".grid5000.fr"
         }
+    if g5k_configuration.get('ssh_multiplex') and _make_control_path_dir():
+        multiplex_options = ( '-o', 'ControlMaster=auto',
+                              '-o', 'ControlPath=~/.execo/cm-%r@%h:%p',
+                              '-o', 'ControlPersist=600' )
+        for options in [ 'ssh_options', 'scp_options', 'taktuk_connector_options' ]:
+            default_frontend_connection_params[options] = tuple(default_connection_params[options]) + multiplex_options
 # _ENDOF_ default_frontend_connection_params
     return default_frontend_connection_params
 
+__cf = get_user_config_filename()
+# g5k_configuration is loaded first, as ssh_multiplex is needed to
+# build default_frontend_connection_params. The user configuration
+# file is thus executed twice
+if __cf:
+    load_configuration(
+        __cf,
+        ((g5k_configuration, 'g5k_configuration'),))
+
 default_frontend_connection_params = make_default_frontend_connection_params()
-"""Default connection params when connecting to a Grid5000 frontend."""
+"""Default connection params when connecting to a Grid5000 frontend.
+
+If ``g5k_configuration['ssh_multiplex']`` is True, ssh, scp and
+taktuk connections to frontends are multiplexed: the first connection
+to a frontend stays open in the background for 10 minutes, and
+subsequent connections to the same frontend reuse it, avoiding a full
+ssh handshake. If directory ``~/.execo/``, where the control sockets
+are created, cannot be created, multiplexing is disabled.
+"""
 
-__cf = get_user_config_filename()
 if __cf:
     load_configuration(
         __cf,
-        ((g5k_configuration, 'g5k_configuration'),
-         (default_frontend_connection_params, 'default_frontend_connection_params'),
+        ((default_frontend_connection_params, 'default_frontend_connection_params'),
          (default_oarsh_oarcp_params, 'default_oarsh_oarcp_params')))
@@ -19,20 +19,28 @@
 from .config import g5k_configuration
 from execo.action import Remote, ActionNotificationProcessLH, \
     Action, get_remote
-from execo.config import make_connection_params
+from execo.config import make_connection_params, DETAIL
 from execo.host import get_hosts_set, Host
 from execo.log import style, logger
-from execo.process import ProcessOutputHandler, get_process, \
+from execo.process import ProcessOutputHandler, \
     handle_process_output
-from execo.time_utils import format_seconds
-from execo.utils import comma_join, compact_output, singleton_to_collection
+from execo.time_utils import format_seconds, sleep
+from execo.utils import compact_output, singleton_to_collection
 from execo_g5k.config import default_frontend_connection_params
-from execo_g5k.utils import get_frontend_host, get_kavlan_host_name
+from execo_g5k.utils import _get_frontend_process, get_kavlan_host_name
 from .utils import get_default_frontend
 import copy
+import random
 import re
+import sys
 import time
 
+if sys.version_info >= (3,):
+    _intern = sys.intern
+else:
+    # python 2 intern() only accepts str, not unicode
+    _intern = lambda s: intern(s) if isinstance(s, str) else s
+
 class Deployment(object):
     """A kadeploy3 deployment, POD style class."""
 
@@ -61,8 +69,8 @@ class Deployment(object):
         """string of other options to pass to kadeploy3"""
 
     def _get_common_kadeploy_command_line(self):
-        cmd_line = g5k_configuration.get('kadeploy3')
-        cmd_line += " " + g5k_configuration.get('kadeploy3_options')
+        cmd_line = [ g5k_configuration.get('kadeploy3'),
+                     g5k_configuration.get('kadeploy3_options') ]
         if self.env_file and self.env_name:
             raise ValueError("Deployment cannot have both env_file and env_name")
         if (not self.env_file) and (not self.env_name):
@@ -71,76 +79,97 @@ class Deployment(object):
             if (not g5k_configuration.get('default_env_name')) and (not g5k_configuration.get('default_env_file')):
                 raise Exception("no environment name or file found")
             if g5k_configuration.get('default_env_name'):
-                cmd_line += " -e %s" % (g5k_configuration['default_env_name'],)
+                cmd_line.append("-e %s" % (g5k_configuration['default_env_name'],))
             elif g5k_configuration.get('default_env_file'):
-                cmd_line += " -a %s" % (g5k_configuration['default_env_file'],)
+                cmd_line.append("-a %s" % (g5k_configuration['default_env_file'],))
         elif self.env_name:
-            cmd_line += " -e %s" % (self.env_name,)
+            cmd_line.append("-e %s" % (self.env_name,))
         elif self.env_file:
-            cmd_line += " -a %s" % (self.env_file,)
+            cmd_line.append("-a %s" % (self.env_file,))
         if self.user != None:
-            cmd_line += " -u %s" % (self.user,)
+            cmd_line.append("-u %s" % (self.user,))
         if self.vlan != None:
-            cmd_line += " --vlan %s" % (self.vlan,)
+            cmd_line.append("--vlan %s" % (self.vlan,))
         if self.other_options:
-            cmd_line += " %s" % (self.other_options,)
-        return cmd_line
+            cmd_line.append("%s" % (self.other_options,))
+        return " ".join(cmd_line)
 
     def __repr__(self):
-        s = ""
-        if self.hosts != None: s = comma_join(s, "hosts=%r" % (self.hosts,))
-        if self.env_file != None: s = comma_join(s, "env_file=%r" % (self.env_file,))
-        if self.env_name != None: s = comma_join(s, "env_name=%r" % (self.env_name,))
-        if self.user != None: s = comma_join(s, "user=%r" % (self.user,))
-        if self.vlan != None: s = comma_join(s, "vlan=%r" % (self.vlan,))
-        if self.other_options: s = comma_join(s, "other_options=%r" % (self.other_options,))
-        return "Deployment(%s)" % (s,)
-
-_ksoh_deployed_nodes_header_re1 = re.compile("^Nodes correctly deployed on cluster \w+\s*$")       # for kadeploy3 < 3.2
-_ksoh_undeployed_nodes_header_re1 = re.compile("^Nodes not correctly deployed on cluster \w+\s*$") # for kadeploy3 < 3.2
-_ksoh_deployed_nodes_header_re2 = re.compile("^The \w+ is successful on nodes\s*$")                # for kadeploy3 >= 3.2
-_ksoh_undeployed_nodes_header_re2 = re.compile("^The \w+ failed on nodes\s*$")                     # for kadeploy3 >= 3.2
-_ksoh_deployed_node_re = re.compile("^(\w+-\d+\.\w+\.grid5000\.fr)\s*$")
-_ksoh_undeployed_node_re = re.compile("^(\w+-\d+\.\w+\.grid5000\.fr)(\s+\(.*)?\s*$")
+        s = []
+        if self.hosts != None: s.append("hosts=%r" % (self.hosts,))
+        if self.env_file != None: s.append("env_file=%r" % (self.env_file,))
+        if self.env_name != None: s.append("env_name=%r" % (self.env_name,))
+        if self.user != None: s.append("user=%r" % (self.user,))
+        if self.vlan != None: s.append("vlan=%r" % (self.vlan,))
+        if self.other_options: s.append("other_options=%r" % (self.other_options,))
+        return "Deployment(%s)" % (", ".join(s),)
+
+_ksoh_line_re = re.compile(
+    "^(?:(?P<deployed_header>Nodes correctly deployed on cluster \w+"      # for kadeploy3 < 3.2
+    "|The \w+ is successful on nodes)"                                     # for kadeploy3 >= 3.2
+    "|(?P<undeployed_header>Nodes not correctly deployed on cluster \w+"   # for kadeploy3 < 3.2
+    "|The \w+ failed on nodes)"                                            # for kadeploy3 >= 3.2
+    "|(?P<host>\w+-\d+\.\w+\.grid5000\.fr)(?P<reason>\s+\(.*)?)\s*$")
 
 class _KadeployStdoutHandler(ProcessOutputHandler):
 
-    """Parse kadeploy3 stdout."""
+    """Parse kadeploy3 stdout.
+
+    Each line is matched against a single regex, which tells if it is
+    a section header or a host. Hosts parsed in a section are added in
+    a batch to the deployed / undeployed hosts of the process and of
+    the Kadeployer, at the end of the section.
+    """
 
     def __init__(self):
         super(_KadeployStdoutHandler, self).__init__()
         self._SECTION_NONE, self._SECTION_DEPLOYED_NODES, self._SECTION_UNDEPLOYED_NODES = list(range(3))
-        self._current_section = self._SECTION_NONE
+        self._current_section = dict() # keys: processes, values:
+                                       # current section in their
+                                       # output
+        self._pending_hosts = dict() # keys: processes, values: list of
+                                     # host addresses parsed in the
+                                     # current section
 
     def action_reset(self):
-        self._current_section = self._SECTION_NONE
+        self._current_section.clear()
+        self._pending_hosts.clear()
+
+    def _flush_pending_hosts(self, process):
+        pending_hosts = self._pending_hosts.pop(process, None)
+        if pending_hosts:
+            section = self._current_section.get(process)
+            if section == self._SECTION_DEPLOYED_NODES:
+                process.kadeployer.deployed_hosts.update(pending_hosts)
+                process.deployed_hosts.update(pending_hosts)
+            elif section == self._SECTION_UNDEPLOYED_NODES:
+                process.kadeployer.undeployed_hosts.update(pending_hosts)
+                process.undeployed_hosts.update(pending_hosts)
 
     def read_line(self, process, stream, string, eof, error):
-        if (_ksoh_deployed_nodes_header_re1.search(string) != None
-            or _ksoh_deployed_nodes_header_re2.search(string) != None):
-            self._current_section = self._SECTION_DEPLOYED_NODES
-            return
-        if (_ksoh_undeployed_nodes_header_re1.search(string) != None
-            or _ksoh_undeployed_nodes_header_re2.search(string) != None):
-            self._current_section = self._SECTION_UNDEPLOYED_NODES
-            return
-        if self._current_section == self._SECTION_DEPLOYED_NODES:
-            so = _ksoh_deployed_node_re.search(string)
-            if so != None:
-                host_address = so.group(1)
-                process.kadeployer.deployed_hosts.add(host_address)
-                process.deployed_hosts.add(host_address)
-        elif self._current_section == self._SECTION_UNDEPLOYED_NODES:
-            so = _ksoh_undeployed_node_re.search(string)
-            if so != None:
-                host_address = so.group(1)
-                process.kadeployer.undeployed_hosts.add(host_address)
-                process.undeployed_hosts.add(host_address)
+        mo = _ksoh_line_re.search(string)
+        if mo != None:
+            if mo.group('deployed_header') != None:
+                self._flush_pending_hosts(process)
+                self._current_section[process] = self._SECTION_DEPLOYED_NODES
+            elif mo.group('undeployed_header') != None:
+                self._flush_pending_hosts(process)
+                self._current_section[process] = self._SECTION_UNDEPLOYED_NODES
+            else:
+                section = self._current_section.get(process)
+                if ((section == self._SECTION_DEPLOYED_NODES and mo.group('reason') == None)
+                    or section == self._SECTION_UNDEPLOYED_NODES):
+                    self._pending_hosts.setdefault(process, []).append(_intern(mo.group('host')))
+        if eof or error:
+            self._flush_pending_hosts(process)
+            self._current_section.pop(process, None)
 
 _host_site_re1 = re.compile("^[^ \t\n\r\f\v\.]+\.([^ \t\n\r\f\v\.]+)\.grid5000.fr$")
 _host_site_re2 = re.compile("^[^ \t\n\r\f\v\.]+\.([^ \t\n\r\f\v\.]+)$")
 _host_site_re3 = re.compile("^[^ \t\n\r\f\v\.]+$")
 
+_host_frontend_cache = dict()
+
 def _get_host_frontend(host):
     # Get the frontend of a host.
     #
@@ -157,6 +186,10 @@ def _get_host_frontend(host):
     #
     # - raises exception if host name format invalid (not sure we
     #   would want this for a generic function)
+    #
+    # results are cached by host address
+    if host.address in _host_frontend_cache:
+        return _host_frontend_cache[host.address]
     frontend = None
     mo1 = _host_site_re1.search(host.address)
     if mo1 != None:
@@ -164,13 +197,14 @@ def _get_host_frontend(host):
     else:
         mo2 = _host_site_re2.search(host.address)
         if mo2 != None:
-            frontend = mo1.group(1)
+            frontend = mo2.group(1)
         else:
             mo3 = _host_site_re3.search(host.address)
             if mo3 != None:
                 frontend = get_default_frontend()
             else:
                 raise ValueError("unknown frontend for host %s" % host.address)
+    _host_frontend_cache[host.address] = frontend
     return frontend
 
 class FrontendPrefixWrapper(ProcessOutputHandler):
@@ -235,21 +269,17 @@ class Kadeployer(Remote):
         self._unique_hosts = get_hosts_set(self.deployment.hosts)
         frontends = dict()
         for host in self._unique_hosts:
-            frontend = _get_host_frontend(host)
-            if frontend in frontends:
-                frontends[frontend].append(host)
-            else:
-                frontends[frontend] = [host]
+            frontends.setdefault(_get_host_frontend(host), []).append(host)
         lifecycle_handler = ActionNotificationProcessLH(self, len(frontends))
         deploy_stdout_handler = _KadeployStdoutHandler()
-        for frontend in frontends:
-            kadeploy_command = self.deployment._get_common_kadeploy_command_line()
-            for host in frontends[frontend]:
-                kadeploy_command += " -m %s" % (host.address,)
-            p = get_process(kadeploy_command,
-                            host = get_frontend_host(frontend),
-                            connection_params = make_connection_params(self.frontend_connection_params,
-                                                                     default_frontend_connection_params))
+        common_kadeploy_command = self.deployment._get_common_kadeploy_command_line()
+        for frontend, frontend_hosts in frontends.items():
+            kadeploy_command = " ".join([ common_kadeploy_command ]
+                                        + [ "-m %s" % (host.address,) for host in frontend_hosts ])
+            p = _get_frontend_process(kadeploy_command,
+                                      frontend = frontend,
+                                      connection_params = make_connection_params(self.frontend_connection_params,
+                                                                               default_frontend_connection_params))
             p.pty = True
             p.timeout = self.timeout
             p.stdout_handlers.append(deploy_stdout_handler)
@@ -259,7 +289,7 @@ class Kadeployer(Remote):
                                        for h in singleton_to_collection(self._stderr_handlers) ])
             p.lifecycle_handlers.append(lifecycle_handler)
             p.frontend = frontend
-            p.kadeploy_hosts = [ host.address for host in frontends[frontend] ]
+            p.kadeploy_hosts = [ _intern(host.address) for host in frontend_hosts ]
             p.deployed_hosts = set()
             p.undeployed_hosts = set()
             p.kadeployer = self
@@ -326,7 +356,10 @@ def deploy(deployment,
            deploy_timeout = None,
            check_timeout = 30,
            stdout_handlers = None,
-           stderr_handlers = None):
+           stderr_handlers = None,
+           max_stagnant_tries = None,
+           retry_delay = None,
+           max_retry_delay = 60):
     """Deploy nodes, many times if needed, checking which of these nodes are already deployed with a user-supplied command. If no command given for checking if nodes deployed, rely on kadeploy to know which nodes are deployed.
 
     - loop `num_tries` times:
@@ -344,6 +377,12 @@ def deploy(deployment,
 
       - deploy the undeployed nodes
 
+      - optionnaly stop early if the last ``max_stagnant_tries``
+        tries did not deploy any new node
+
+      - optionnaly wait before the next try, with an exponential
+        backoff starting at ``retry_delay``
+
     returns a tuple with the list of deployed hosts and the list of
     undeployed hosts.
 
@@ -374,9 +413,10 @@ def deploy(deployment,
 
     :param check_enough_func: a function taking as parameter a list of
       deployed hosts and a list of undeployed hosts, which will be
-      called at each deployment iteration end, and that should return
-      a boolean indicating if there is already enough nodes (in this
-      case, no further deployement will be attempted).
+      called before each deployment try, and that should return a
+      boolean indicating if there is already enough nodes (in this
+      case, no further deployement will be attempted). It is not
+      called once all ``num_tries`` tries are done.
 
     :param frontend_connection_params: connection params for connecting
       to frontends if needed. Values override those in
@@ -393,6 +433,20 @@ def deploy(deployment,
 
     :param stderr_handlers: iterable of `ProcessOutputHandlers`
           which will be passed to the actual deploy processes.
+
+    :param max_stagnant_tries: if not None, stop trying when this
+      number of consecutive tries did not deploy any new node (the
+      remaining nodes are then likely to be broken). Default is None,
+      which means always try up to ``num_tries`` times.
+
+    :param retry_delay: if not None, delay in seconds to wait before
+      the second try. The delay is doubled at each subsequent try, up
+      to ``max_retry_delay``, and randomized by +/- 50% so that
+      concurrent deployments do not hit the frontends at the same
+      time. Default is None, which means retry immediately.
+
+    :param max_retry_delay: maximum delay in seconds between tries,
+      when ``retry_delay`` is not None. Default is 60 seconds.
     """
 
     if check_enough_func == None:
@@ -402,6 +456,8 @@ def deploy(deployment,
         check_deployed_command = g5k_configuration.get('check_deployed_command')
 
     def check_update_deployed(undeployed_hosts, check_deployed_command, node_connection_params, vlan): #IGNORE:W0613
+        if len(undeployed_hosts) == 0:
+            return []
         logger.debug(style.emph("check which hosts are already deployed among:") + " %s", undeployed_hosts)
         deployment_hostnames_mapping = dict()
         if vlan:
@@ -420,11 +476,12 @@ def deploy(deployment,
                 p.timeout = check_timeout
         deployed_check.run()
         newly_deployed = list()
+        # formatted lazily by logger, only if debug logs are enabled
+        check_log_format = (style.emph("check on %s:") + " %s\n"
+                            + style.emph("stdout:") + "\n%s\n"
+                            + style.emph("stderr:") + "\n%s\n")
         for process in deployed_check.processes:
-            logger.debug(style.emph("check on %s:" % (process.host,))
-                         + " %s\n" % (process,)
-                         + style.emph("stdout:") + "\n%s\n" % (process.stdout)
-                         + style.emph("stderr:") + "\n%s\n" % (process.stderr))
+            logger.debug(check_log_format, process.host, process, process.stdout, process.stderr)
             if (process.ok):
                 newly_deployed.append(deployment_hostnames_mapping[process.host.address])
                 logger.debug("OK %s", deployment_hostnames_mapping[process.host.address])
@@ -434,15 +491,17 @@ def deploy(deployment,
 
     start_time = time.time()
     deployed_hosts = set()
-    undeployed_hosts = set([ Host(host).address for host in deployment.hosts ])
+    undeployed_hosts = set([ host.address if isinstance(host, Host) else host
+                             for host in deployment.hosts ])
     my_newly_deployed = []
     if check_deployed_command:
         my_newly_deployed = check_update_deployed(undeployed_hosts, check_deployed_command, node_connection_params, deployment.vlan)
         deployed_hosts.update(my_newly_deployed)
         undeployed_hosts.difference_update(my_newly_deployed)
     num_tries_done = 0
-    elapsed = time.time() - start_time
+    num_stagnant_tries = 0
     last_time = time.time()
+    elapsed = last_time - start_time
     deploy_stats = list()   # contains tuples ( timestamp,
                             #                   num attempted deploys,
                             #                   len(kadeployer.deployed_hosts),
@@ -450,12 +509,15 @@ def deploy(deployment,
                             #                   len(deployed_hosts),
                             #                   len(undeployed_hosts )
     deploy_stats.append((elapsed, None, None, len(my_newly_deployed), len(deployed_hosts), len(undeployed_hosts)))
-    while (not check_enough_func(deployed_hosts, undeployed_hosts)
-           and num_tries_done < num_tries):
+    while (num_tries_done < num_tries
+           and not check_enough_func(deployed_hosts, undeployed_hosts)):
+        if retry_delay != None and num_tries_done > 0:
+            sleep(min(max_retry_delay, retry_delay * 2 ** (num_tries_done - 1))
+                  * random.uniform(0.5, 1.5))
         num_tries_done += 1
         logger.debug(style.emph("try %i, deploying on:" % (num_tries_done,)) + " %s", undeployed_hosts)
         tmp_deployment = copy.copy(deployment)
-        tmp_deployment.hosts = undeployed_hosts
+        tmp_deployment.hosts = set(undeployed_hosts)
         kadeployer = Kadeployer(tmp_deployment,
                                 frontend_connection_params = frontend_connection_params,
                                 stdout_handlers = stdout_handlers,
@@ -474,29 +536,33 @@ def deploy(deployment,
         logger.debug(style.emph("check reported newly deployed hosts:") + "   %s", my_newly_deployed)
         logger.debug(style.emph("all deployed hosts:") + "     %s", deployed_hosts)
         logger.debug(style.emph("still undeployed hosts:") + " %s", undeployed_hosts)
-        elapsed = time.time() - last_time
-        last_time = time.time()
+        if len(undeployed_hosts) < len(tmp_deployment.hosts):
+            num_stagnant_tries = 0
+        else:
+            num_stagnant_tries += 1
+        now = time.time()
+        elapsed = now - last_time
+        last_time = now
         deploy_stats.append((elapsed,
                              len(tmp_deployment.hosts),
                              len(kadeployer.deployed_hosts),
                              len(my_newly_deployed),
                              len(deployed_hosts),
                              len(undeployed_hosts)))
-
-    logger.detail(style.emph("deploy finished") + " in %i tries, %s", num_tries_done, format_seconds(time.time() - start_time))
-    logger.detail("deploy  duration  attempted  deployed     deployed     total     total")
-    logger.detail("                  deploys    as reported  as reported  already   still")
-    logger.detail("                             by kadeploy  by check     deployed  undeployed")
-    logger.detail("---------------------------------------------------------------------------")
-    for (deploy_index, deploy_stat) in enumerate(deploy_stats):
-        logger.detail("#%-5.5s  %-8.8s  %-9.9s  %-11.11s  %-11.11s  %-8.8s  %-10.10s",
-            deploy_index,
-            format_seconds(deploy_stat[0]),
-            deploy_stat[1],
-            deploy_stat[2],
-            deploy_stat[3],
-            deploy_stat[4],
-            deploy_stat[5])
+        if max_stagnant_tries != None and num_stagnant_tries >= max_stagnant_tries:
+            logger.detail("no new node deployed in the last %i tries, giving up", num_stagnant_tries)
+            break
+
+    if logger.getEffectiveLevel() <= DETAIL:
+        # the whole stats table as a single log record
+        deploy_summary = [ style.emph("deploy finished") + " in %i tries, %s" % (num_tries_done, format_seconds(time.time() - start_time)),
+                           "deploy  duration  attempted  deployed     deployed     total     total",
+                           "                  deploys    as reported  as reported  already   still",
+                           "                             by kadeploy  by check     deployed  undeployed",
+                           "---------------------------------------------------------------------------" ]
+        deploy_summary.extend([ "#%-5.5s  %-8.8s  %-9.9s  %-11.11s  %-11.11s  %-8.8s  %-10.10s" % ((deploy_index, format_seconds(deploy_stat[0])) + deploy_stat[1:])
+                                for (deploy_index, deploy_stat) in enumerate(deploy_stats) ])
+        logger.detail("\n".join(deploy_summary))
     logger.debug(style.emph("deployed hosts:") + " %s", deployed_hosts)
     logger.debug(style.emph("undeployed hosts:") + " %s", undeployed_hosts)
 
@@ -20,14 +20,13 @@ from .config import g5k_configuration
 from execo.config import make_connection_params
 from execo.exception import ProcessesFailed
 from execo.host import Host
-from execo.process import get_process
+from execo.log import logger
 from execo.time_utils import get_unixts, get_seconds, str_date_to_unixts, \
     str_duration_to_seconds, format_duration, format_date, Timer, sleep
-from execo.utils import comma_join
 from execo_g5k.config import default_frontend_connection_params
 from execo.utils import checked_min, singleton_to_collection
-from execo_g5k.utils import get_frontend_host
-import os, re, time, codecs
+from execo_g5k.utils import _get_frontend_process
+import os, re, time, codecs, pipes
 
 def _date_in_range(date, date_range):
     """Check that a date is inside a range. If range is None, return True."""
@@ -38,6 +37,74 @@ def _date_in_range(date, date_range):
         return False
     return True
 
+_batch_marker = "=== execo batch %i ==="
+_batch_exit_marker = "=== execo batch %i exit $execo_exit ==="
+_batch_marker_re = re.compile("^=== execo batch (\d+)(?: exit (\d+))? ===\s*$", re.MULTILINE)
+
+def _get_batch_commandline(cmdlines):
+    # build a single shell command line running several commands
+    # (given as an iterable of tuples (index, cmdline)), each command
+    # output (stdout and stderr) being preceded by a marker line
+    # identifying it, and followed by a marker line with its exit
+    # code. The command line exit code is the one of the last failed
+    # command, or 0 if all succeeded
+    return ("execo_status=0; "
+            + "; ".join([ "echo '%s'; { %s; } 2>&1; execo_exit=$?; echo \"%s\"; [ $execo_exit -eq 0 ] || execo_status=$execo_exit" % (
+                        _batch_marker % (index,),
+                        cmdline,
+                        _batch_exit_marker % (index,))
+                          for (index, cmdline) in cmdlines ])
+            + "; exit $execo_status")
+
+def _split_batch_output(output):
+    # split the output of a command line built with
+    # _get_batch_commandline, returns a dict whose keys are the
+    # commands indexes, and values tuples (exit code, output). exit
+    # code is None if the command did not terminate (e.g. timeout)
+    outputs = dict()
+    chunks = _batch_marker_re.split(output)
+    for i in range(1, len(chunks) - 2, 3):
+        index = int(chunks[i])
+        if chunks[i + 1] == None:
+            outputs[index] = (None, chunks[i + 2])
+        elif index in outputs:
+            outputs[index] = (int(chunks[i + 1]), outputs[index][1])
+    return outputs
+
+_job_info_cache = dict()
+
+def _get_cached_job_infos(keys):
+    # return a list of copies of the cached job infos for the given
+    # keys, with None for keys for which there is none, or if it is
+    # older than g5k_configuration['oar_info_cache_ttl']
+    ttl = g5k_configuration.get('oar_info_cache_ttl')
+    if not ttl:
+        _job_info_cache.clear()
+        return [ None for key in keys ]
+    now = time.time()
+    # drop expired entries, once per lookup, so that the cache does
+    # not grow forever
+    for k in [ k for (k, entry) in list(_job_info_cache.items()) if now - entry[0] >= ttl ]:
+        _job_info_cache.pop(k, None)
+    infos = []
+    for key in keys:
+        entry = _job_info_cache.get(key)
+        if entry != None:
+            infos.append(dict(entry[1]))
+        else:
+            infos.append(None)
+    return infos
+
+def _set_cached_job_info(key, job_info):
+    # empty job infos (errors, unscheduled jobs) are not cached
+    if job_info and g5k_configuration.get('oar_info_cache_ttl'):
+        _job_info_cache[key] = (time.time(), dict(job_info))
+
+# formatted dates, keyed on the integer unix timestamp so that all
+# date formats share entries. Bounded: cleared when full
+_oar_date_cache = {}
+_oar_date_cache_max_size = 256
+
 def format_oar_date(ts):
     """Return a string with the formatted date (year, month, day, hour, min, sec, ms) formatted for oar/oargrid.
 
@@ -45,9 +112,19 @@ def format_oar_date(ts):
 
     :param tz: a date in one of the formats handled.
     """
-    # forking code because modifying os.environ["TZ"] and calling
-    # time.tzset() is not thread-safe
     ts = int(get_unixts(ts))
+    formatted_time = _oar_date_cache.get(ts)
+    if formatted_time == None:
+        formatted_time = _format_oar_unixts(ts)
+        if len(_oar_date_cache) >= _oar_date_cache_max_size:
+            _oar_date_cache.clear()
+        _oar_date_cache[ts] = formatted_time
+    return formatted_time
+
+def _format_oar_unixts(ts):
+    # forking code because modifying os.environ["TZ"] and calling
+    # time.tzset() is not thread-safe. As it is costly, results are
+    # cached by format_oar_date
     rend, wend = os.pipe()
     pid = os.fork()
     if pid == 0:
@@ -55,7 +132,7 @@ def format_oar_date(ts):
         time.tzset()
         t = time.localtime(ts)
         formatted_time = time.strftime("%Y-%m-%d %H:%M:%S", t)
-        os.write(wend, formatted_time)
+        os.write(wend, formatted_time.encode())
         os._exit(0)
     else:
         os.close(wend)
@@ -70,24 +147,9 @@ def format_oar_duration(duration):
 
     :param duration: a duration in one of the formats handled.
     """
-    duration = get_seconds(duration)
-    s = duration
-    h = (s - (s % 3600)) // 3600
-    s -= h * 3600
-    m = (s - (s % 60)) // 60
-    s -= m * 60
-    s = int(s)
-    formatted_duration = ""
-    if duration >= 3600:
-        formatted_duration += "%i:" % h
-    else:
-        formatted_duration += "0:"
-    if duration >= 60:
-        formatted_duration += "%i:" % m
-    else:
-        formatted_duration += "0:"
-    formatted_duration += "%i" % s
-    return formatted_duration
+    h, s = divmod(get_seconds(duration), 3600)
+    m, s = divmod(s, 60)
+    return "%i:%i:%i" % (h, m, s)
 
 def oar_date_to_unixts(date):
     """Convert a date in the format returned by oar/oargrid to an unix timestamp.
@@ -180,56 +242,58 @@ class OarSubmission(object):
         self.command = command
 
     def __repr__(self):
-        s = ""
-        if self.resources != None: s = comma_join(s, "resources=%r" % (self.resources,))
-        if self.walltime != None: s = comma_join(s, "walltime=%r" % (format_duration(self.walltime),))
-        if self.job_type != None: s = comma_join(s, "job_type=%r" % (self.job_type,))
-        if self.sql_properties != None: s = comma_join(s, "sql_properties=%r" % (self.sql_properties,))
-        if self.queue != None: s = comma_join(s, "queue=%r" % (self.queue,))
-        if self.reservation_date != None: s = comma_join(s, "reservation_date=%r" % (format_date(self.reservation_date),))
-        if self.directory != None: s = comma_join(s, "directory=%r" % (self.directory,))
-        if self.project != None: s = comma_join(s, "project=%r" % (self.project,))
-        if self.name != None: s = comma_join(s, "name=%r" % (self.name,))
-        if self.additional_options != None: s = comma_join(s, "additional_options=%r" % (self.additional_options,))
-        if self.command != None: s = comma_join(s, "command=%r" % (self.command,))
-        return "OarSubmission(%s)" % (s,)
+        s = []
+        if self.resources != None: s.append("resources=%r" % (self.resources,))
+        if self.walltime != None: s.append("walltime=%r" % (format_duration(self.walltime),))
+        if self.job_type != None: s.append("job_type=%r" % (self.job_type,))
+        if self.sql_properties != None: s.append("sql_properties=%r" % (self.sql_properties,))
+        if self.queue != None: s.append("queue=%r" % (self.queue,))
+        if self.reservation_date != None: s.append("reservation_date=%r" % (format_date(self.reservation_date),))
+        if self.directory != None: s.append("directory=%r" % (self.directory,))
+        if self.project != None: s.append("project=%r" % (self.project,))
+        if self.name != None: s.append("name=%r" % (self.name,))
+        if self.additional_options != None: s.append("additional_options=%r" % (self.additional_options,))
+        if self.command != None: s.append("command=%r" % (self.command,))
+        return "OarSubmission(%s)" % (", ".join(s),)
 
 def get_oarsub_commandline(job_spec):
-    oarsub_cmdline = 'oarsub'
+    oarsub_cmdline = [ 'oarsub' ]
     if job_spec.additional_options != None:
-        oarsub_cmdline += ' %s' % (job_spec.additional_options,)
+        oarsub_cmdline.append('%s' % (job_spec.additional_options,))
     if job_spec.resources:
-        oarsub_cmdline += ' -l "' + '+'.join(singleton_to_collection(job_spec.resources))
+        resources = '+'.join(singleton_to_collection(job_spec.resources))
         if job_spec.walltime != None:
-            oarsub_cmdline += ',walltime=%s' % (format_oar_duration(job_spec.walltime),)
-        oarsub_cmdline += '"'
+            resources += ',walltime=%s' % (format_oar_duration(job_spec.walltime),)
+        oarsub_cmdline.append('-l %s' % (pipes.quote(resources),))
     elif job_spec.walltime != None:
-        oarsub_cmdline += ' -l "walltime=%s"' % (format_oar_duration(job_spec.walltime),)
+        oarsub_cmdline.append('-l %s' % (pipes.quote('walltime=%s' % (format_oar_duration(job_spec.walltime),)),))
     key = g5k_configuration.get('oar_job_key_file')
     if key == None:
         key = os.environ.get('OAR_JOB_KEY_FILE')
     if key != None:
-        oarsub_cmdline += ' -k -i %s' % (key,)
+        oarsub_cmdline.append('-k -i %s' % (pipes.quote(key),))
     if job_spec.job_type != None:
         for t in singleton_to_collection(job_spec.job_type):
-            oarsub_cmdline += ' -t "%s"' % (t,)
+            oarsub_cmdline.append('-t %s' % (pipes.quote(t),))
     if job_spec.sql_properties != None:
-        oarsub_cmdline += ' -p "%s"' % (job_spec.sql_properties,)
+        oarsub_cmdline.append('-p %s' % (pipes.quote(job_spec.sql_properties),))
     if job_spec.queue != None:
-        oarsub_cmdline += ' -q "%s"' % (job_spec.queue,)
+        oarsub_cmdline.append('-q %s' % (pipes.quote(job_spec.queue),))
     if job_spec.reservation_date != None:
-        oarsub_cmdline += ' -r "%s"' % (format_oar_date(job_spec.reservation_date),)
+        oarsub_cmdline.append('-r %s' % (pipes.quote(format_oar_date(job_spec.reservation_date)),))
     if job_spec.directory != None:
-        oarsub_cmdline += ' -d "%s"' % (job_spec.directory,)
+        oarsub_cmdline.append('-d %s' % (pipes.quote(job_spec.directory),))
     if job_spec.project != None:
-        oarsub_cmdline += ' --project "%s"' % (job_spec.project,)
+        oarsub_cmdline.append('--project %s' % (pipes.quote(job_spec.project),))
     if job_spec.name != None:
-        oarsub_cmdline += ' -n "%s"' % (job_spec.name,)
+        oarsub_cmdline.append('-n %s' % (pipes.quote(job_spec.name),))
     if job_spec.command != None:
-        oarsub_cmdline += ' "%s"' % (job_spec.command,)
+        oarsub_cmdline.append(pipes.quote(job_spec.command))
     else:
-        oarsub_cmdline += ' "sleep 31536000"'
-    return oarsub_cmdline
+        oarsub_cmdline.append('"sleep 31536000"')
+    return " ".join(oarsub_cmdline)
+
+_oarsub_job_id_re = re.compile("^OAR_JOB_ID=(\d+)\s*$", re.MULTILINE)
 
 def oarsub(job_specs, frontend_connection_params = None, timeout = False, abort_on_error = False):
     """Submit jobs.
@@ -254,35 +318,63 @@ def oarsub(job_specs, frontend_connection_params = None, timeout = False, abort_
     None for default frontend. If submission error, oarjob id ==
     None. The returned list matches, in the same order, the job_specs
     parameter.
+
+    All jobs submitted to the same frontend are submitted through a
+    single (ssh) connection to this frontend, one after the other. The
+    timeout applies to each job, so the timeout of the connection to a
+    frontend is the timeout multiplied by the number of jobs submitted
+    to it. If any of these jobs fails, the process of this connection
+    fails, and it is in the exception raised if abort_on_error is
+    True. The output of each failed oarsub is logged.
     """
     if isinstance(timeout, bool) and timeout == False:
         timeout = g5k_configuration.get('default_timeout')
+    frontends_cmdlines = dict() # keys: frontends, values: lists of
+                                # tuples (index in job_specs, oarsub
+                                # command line)
+    oar_job_ids = []
+    for (index, (spec, frontend)) in enumerate(job_specs):
+        frontends_cmdlines.setdefault(frontend, []).append((index, get_oarsub_commandline(spec)))
+        oar_job_ids.append((None, frontend))
+    if len(oar_job_ids) == 0:
+        return oar_job_ids
+    actual_connection_params = make_connection_params(frontend_connection_params,
+                                                      default_frontend_connection_params)
     processes = []
-    for (spec, frontend) in job_specs:
-        oarsub_cmdline = get_oarsub_commandline(spec)
-        p = get_process(oarsub_cmdline,
-                        host = get_frontend_host(frontend),
-                        connection_params = make_connection_params(frontend_connection_params,
-                                                                   default_frontend_connection_params))
-        p.timeout = timeout
-        p.pty = True
+    for frontend in frontends_cmdlines:
+        p = _get_frontend_process(_get_batch_commandline(frontends_cmdlines[frontend]),
+                                  frontend = frontend,
+                                  connection_params = actual_connection_params)
+        if timeout != None:
+            p.timeout = get_seconds(timeout) * len(frontends_cmdlines[frontend])
+        else:
+            p.timeout = None
+        p.pty = False
         p.frontend = frontend
+        p.oarsub_indexes = [ index for (index, _) in frontends_cmdlines[frontend] ]
         processes.append(p)
-    oar_job_ids = []
-    if len(processes) == 0:
-        return oar_job_ids
     for process in processes: process.start()
     for process in processes: process.wait()
     failed_processes = []
     for process in processes:
-        job_id = None
-        if process.ok:
-            mo = re.search("^OAR_JOB_ID=(\d+)\s*$", process.stdout, re.MULTILINE)
-            if mo != None:
+        outputs = _split_batch_output(process.stdout)
+        process_failed = False
+        for index in process.oarsub_indexes:
+            job_id = None
+            exit_code, output = outputs.get(index, (None, ""))
+            mo = _oarsub_job_id_re.search(output)
+            if mo != None and exit_code == 0:
                 job_id = int(mo.group(1))
-        if job_id == None:
+            else:
+                process_failed = True
+                if index in outputs:
+                    # if the oarsub did not run at all, the failure is
+                    # already logged with the process
+                    logger.warning("oarsub on frontend %s failed, exit code %s:\n%s" % (
+                            process.frontend, exit_code, output.strip()))
+            oar_job_ids[index] = (job_id, process.frontend)
+        if process_failed:
             failed_processes.append(process)
-        oar_job_ids.append((job_id, process.frontend))
     if len(failed_processes) > 0 and abort_on_error:
         raise ProcessesFailed(failed_processes)
     else:
@@ -306,18 +398,25 @@ def oardel(job_specs, frontend_connection_params = None, timeout = False):
       means use
       ``execo_g5k.config.g5k_configuration['default_timeout']``. None
       means no timeout.
+
+    All jobs of the same frontend are deleted with a single oardel
+    invocation.
     """
     if isinstance(timeout, bool) and timeout == False:
         timeout = g5k_configuration.get('default_timeout')
-    processes = []
+    frontends_job_ids = dict()
     for (job_id, frontend) in job_specs:
-        p = get_process("oardel %i" % (job_id,),
-                        host = get_frontend_host(frontend),
-                        connection_params = make_connection_params(frontend_connection_params,
-                                                                   default_frontend_connection_params))
+        frontends_job_ids.setdefault(frontend, []).append(job_id)
+    actual_connection_params = make_connection_params(frontend_connection_params,
+                                                      default_frontend_connection_params)
+    processes = []
+    for frontend in frontends_job_ids:
+        p = _get_frontend_process("oardel %s" % (" ".join([ "%i" % (job_id,) for job_id in frontends_job_ids[frontend] ]),),
+                                  frontend = frontend,
+                                  connection_params = actual_connection_params)
         p.timeout = timeout
         p.nolog_exit_code = True
-        p.pty = True
+        p.pty = False
         processes.append(p)
     for process in processes: process.start()
     for process in processes: process.wait()
@@ -363,11 +462,12 @@ def get_current_oar_jobs(frontends = None,
     processes = []
     if frontends == None:
         frontends = [ None ]
+    actual_connection_params = make_connection_params(frontend_connection_params,
+                                                      default_frontend_connection_params)
     for frontend in frontends:
-        p = get_process("oarstat -u",
-                        host = get_frontend_host(frontend),
-                        connection_params = make_connection_params(frontend_connection_params,
-                                                                   default_frontend_connection_params))
+        p = _get_frontend_process("oarstat -u",
+                                  frontend = frontend,
+                                  connection_params = actual_connection_params)
         p.timeout = timeout
         p.pty = True
         p.frontend = frontend
@@ -380,8 +480,12 @@ def get_current_oar_jobs(frontends = None,
     failed_processes = []
     for process in processes:
         if process.ok:
-            jobs = re.findall("^(\d+)\s", process.stdout, re.MULTILINE)
-            oar_job_ids.extend([ (int(jobid), process.frontend) for jobid in jobs ])
+            # job lines start with the job id, header lines don't
+            for line in process.stdout.splitlines():
+                if line[:1].isdigit():
+                    jobid = line.split(None, 1)[0]
+                    if jobid.isdigit():
+                        oar_job_ids.append((int(jobid), process.frontend))
         else:
             failed_processes.append(process)
     if len(failed_processes) > 0 and abort_on_error:
@@ -389,17 +493,39 @@ def get_current_oar_jobs(frontends = None,
     else:
         if start_between or end_between:
             filtered_job_ids = []
-            for jobfrontend in oar_job_ids:
-                info = get_oar_job_info(jobfrontend[0], jobfrontend[1],
-                                        frontend_connection_params, timeout,
-                                        nolog_exit_code = True, nolog_timeout = True,
-                                        nolog_error = True)
+            infos = get_oar_jobs_infos(oar_job_ids, frontend_connection_params, timeout)
+            for jobfrontend, info in zip(oar_job_ids, infos):
                 if (_date_in_range(info['start_date'], start_between)
                     and _date_in_range(info['start_date'] + info['walltime'], end_between)):
                     filtered_job_ids.append(jobfrontend)
             oar_job_ids = filtered_job_ids
         return oar_job_ids
 
+_oarstat_job_info_re = re.compile("^\s*(?:startTime = (?P<start_date>\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d)"
+                                  "|walltime = (?P<walltime>\d+:\d?\d:\d?\d)"
+                                  "|scheduledStart = (?P<scheduled_start>\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d)"
+                                  "|state = (?P<state>\w*)"
+                                  "|name = (?P<name>[ \t\S]*))\s*$", re.MULTILINE)
+
+def _get_oar_job_info_cmdline(oar_job_id):
+    return "oarstat -fj %i" % (oar_job_id,)
+
+def _parse_oar_job_info(output):
+    job_info = dict()
+    # single pass on oarstat output, keeping the first occurence of
+    # each field
+    for mo in _oarstat_job_info_re.finditer(output):
+        field = mo.lastgroup
+        if field in job_info: continue
+        value = mo.group(field)
+        if field == 'start_date' or field == 'scheduled_start':
+            job_info[field] = oar_date_to_unixts(value)
+        elif field == 'walltime':
+            job_info[field] = oar_duration_to_seconds(value)
+        else:
+            job_info[field] = value
+    return job_info
+
 def get_oar_job_info(oar_job_id = None, frontend = None,
                      frontend_connection_params = None, timeout = False,
                      nolog_exit_code = False, nolog_timeout = False, nolog_error = False):
@@ -443,40 +569,91 @@ def get_oar_job_info(oar_job_id = None, frontend = None,
         timeout = g5k_configuration.get('default_timeout')
     if oar_job_id == None:
         if 'OAR_JOB_ID' in os.environ:
-            oar_job_id = os.environ['OAR_JOB_ID']
+            oar_job_id = int(os.environ['OAR_JOB_ID'])
         else:
             raise ValueError("no oar job id given and no OAR_JOB_ID environment variable found")
-    process = get_process("oarstat -fj %i" % (oar_job_id,),
-                          host = get_frontend_host(frontend),
-                          connection_params = make_connection_params(frontend_connection_params,
-                                                                     default_frontend_connection_params))
+    job_info = _get_cached_job_infos([ ('oar', oar_job_id, frontend) ])[0]
+    if job_info != None:
+        return job_info
+    return _fetch_oar_job_info(oar_job_id, frontend, frontend_connection_params,
+                               timeout, nolog_exit_code, nolog_timeout, nolog_error)
+
+def _fetch_oar_job_info(oar_job_id, frontend, frontend_connection_params,
+                        timeout, nolog_exit_code, nolog_timeout, nolog_error):
+    # same as get_oar_job_info, without the cache lookup, but still
+    # updating the cache
+    process = _get_frontend_process(_get_oar_job_info_cmdline(oar_job_id),
+                                    frontend = frontend,
+                                    connection_params = make_connection_params(frontend_connection_params,
+                                                                               default_frontend_connection_params))
     process.timeout = timeout
     process.pty = True
     process.nolog_exit_code = nolog_exit_code
     process.nolog_timeout = nolog_timeout
     process.nolog_error = nolog_error
     process.run()
-    job_info = dict()
-    start_date_result = re.search("^\s*startTime = (\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d)\s*$", process.stdout, re.MULTILINE)
-    if start_date_result:
-        start_date = oar_date_to_unixts(start_date_result.group(1))
-        job_info['start_date'] = start_date
-    walltime_result = re.search("^\s*walltime = (\d+:\d?\d:\d?\d)\s*$", process.stdout, re.MULTILINE)
-    if walltime_result:
-        walltime = oar_duration_to_seconds(walltime_result.group(1))
-        job_info['walltime'] = walltime
-    scheduled_start_result = re.search("^\s*scheduledStart = (\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d)\s*$", process.stdout, re.MULTILINE)
-    if scheduled_start_result:
-        scheduled_start = oar_date_to_unixts(scheduled_start_result.group(1))
-        job_info['scheduled_start'] = scheduled_start
-    state_result = re.search("^\s*state = (\w*)\s*$", process.stdout, re.MULTILINE)
-    if state_result:
-        job_info['state'] = state_result.group(1)
-    name_result = re.search("^\s*name = ([ \t\S]*)\s*$", process.stdout, re.MULTILINE)
-    if name_result:
-        job_info['name'] = name_result.group(1)
+    job_info = _parse_oar_job_info(process.stdout)
+    _set_cached_job_info(('oar', oar_job_id, frontend), job_info)
     return job_info
 
+def get_oar_jobs_infos(oar_job_ids, frontend_connection_params = None, timeout = False):
+    """Return a list of dicts with informations about several oar jobs.
+
+    Same as `execo_g5k.oar.get_oar_job_info`, but uses only one
+    connection per frontend, running all the oarstat in a batch. Jobs
+    whose infos are in the cache are not queried.
+
+    :param oar_job_ids: iterable of tuples (oar job id, frontend)
+
+    :param frontend_connection_params: connection params for connecting
+      to frontends if needed. Values override those in
+      `execo_g5k.config.default_frontend_connection_params`.
+
+    :param timeout: timeout for retrieving. Default is False, which
+      means use
+      ``execo_g5k.config.g5k_configuration['default_timeout']``. None
+      means no timeout.
+
+    Returns a list of job infos dicts, in the same order as
+    oar_job_ids. A dict is empty if no info could be retrieved for the
+    corresponding job.
+    """
+    oar_job_ids = list(oar_job_ids)
+    if isinstance(timeout, bool) and timeout == False:
+        timeout = g5k_configuration.get('default_timeout')
+    infos = _get_cached_job_infos([ ('oar', job_id, frontend) for (job_id, frontend) in oar_job_ids ])
+    frontends_cmdlines = dict()
+    for index, (job_id, frontend) in enumerate(oar_job_ids):
+        if infos[index] == None:
+            frontends_cmdlines.setdefault(frontend, []).append((index, _get_oar_job_info_cmdline(job_id)))
+    if len(frontends_cmdlines) == 0:
+        return infos
+    actual_connection_params = make_connection_params(frontend_connection_params,
+                                                      default_frontend_connection_params)
+    processes = []
+    for frontend in frontends_cmdlines:
+        p = _get_frontend_process(_get_batch_commandline(frontends_cmdlines[frontend]),
+                                  frontend = frontend,
+                                  connection_params = actual_connection_params)
+        p.timeout = timeout
+        p.pty = True
+        p.nolog_exit_code = True
+        p.nolog_timeout = True
+        p.nolog_error = True
+        processes.append(p)
+    for process in processes: process.start()
+    for process in processes: process.wait()
+    outputs = dict()
+    for process in processes:
+        outputs.update(_split_batch_output(process.stdout))
+    for index, (job_id, frontend) in enumerate(oar_job_ids):
+        if infos[index] == None:
+            infos[index] = _parse_oar_job_info(outputs.get(index, (None, ""))[1])
+            _set_cached_job_info(('oar', job_id, frontend), infos[index])
+    return infos
+
+_max_polling_backoff = 16
+
 def wait_oar_job_start(oar_job_id = None, frontend = None,
                        frontend_connection_params = None,
                        timeout = None,
@@ -487,7 +664,11 @@ def wait_oar_job_start(oar_job_id = None, frontend = None,
     / poll every
     ``execo_g5k.config.g5k_configuration['polling_interval']`` seconds
     until it is scheduled. Then, knowing its start date, it will sleep
-    the amount of time necessary to wait for the job start.
+    the amount of time necessary to wait for the job start. While the
+    predicted start is far and does not change, the polling interval
+    is doubled at each poll (up to 16 times
+    ``polling_interval``), but never exceeds half the time remaining
+    to the predicted start.
 
     returns True if wait was successful, False otherwise (job
     cancelled, error)
@@ -518,18 +699,27 @@ def wait_oar_job_start(oar_job_id = None, frontend = None,
                 prediction_callback(prediction)
         return prediction
 
+    if oar_job_id == None:
+        if 'OAR_JOB_ID' in os.environ:
+            oar_job_id = int(os.environ['OAR_JOB_ID'])
+        else:
+            raise ValueError("no oar job id given and no OAR_JOB_ID environment variable found")
     prediction = None
+    backoff = 1
     countdown = Timer(timeout)
     while countdown.remaining() == None or countdown.remaining() > 0:
-        infos = get_oar_job_info(oar_job_id, frontend, frontend_connection_params,
-                                 countdown.remaining(), nolog_exit_code = True,
-                                 nolog_timeout = True, nolog_error = True)
+        # always get fresh infos, bypassing the cache
+        infos = _fetch_oar_job_info(oar_job_id, frontend, frontend_connection_params,
+                                    countdown.remaining(), nolog_exit_code = True,
+                                    nolog_timeout = True, nolog_error = True)
         now = time.time()
         if 'start_date' in infos or 'scheduled_start' in infos:
             if 'start_date' in infos:
                 new_prediction = infos['start_date']
             elif 'scheduled_start' in infos:
                 new_prediction = infos['scheduled_start']
+            if new_prediction != prediction:
+                backoff = 1
             prediction = check_prediction_changed(prediction, new_prediction)
         if 'state' in infos:
             if infos['state'] == "Terminated" or infos['state'] == "Error":
@@ -543,6 +733,18 @@ def wait_oar_job_start(oar_job_id = None, frontend = None,
             elif now + g5k_configuration.get('polling_interval') > new_prediction:
                 sleep(until = checked_min(new_prediction, now + countdown.remaining() if countdown.remaining() != None else None))
                 continue
+            else:
+                # start is far: poll less and less often while the
+                # prediction does not change, but never sleep more
+                # than half the time to the predicted start, nor less
+                # than the polling interval
+                polling_interval = g5k_configuration.get('polling_interval')
+                sleep(checked_min(max(polling_interval,
+                                      min(polling_interval * backoff,
+                                          (new_prediction - now) / 2)),
+                                  countdown.remaining()))
+                backoff = min(backoff * 2, _max_polling_backoff)
+                continue
         sleep(checked_min(g5k_configuration.get('polling_interval'), countdown.remaining()))
     return False
 
@@ -572,20 +774,20 @@ def get_oar_job_nodes(oar_job_id = None, frontend = None,
         timeout = g5k_configuration.get('default_timeout')
     if oar_job_id == None:
         if 'OAR_JOB_ID' in os.environ:
-            oar_job_id = os.environ['OAR_JOB_ID']
+            oar_job_id = int(os.environ['OAR_JOB_ID'])
         else:
             raise ValueError("no oar job id given and no OAR_JOB_ID environment variable found")
     countdown = Timer(timeout)
     wait_oar_job_start(oar_job_id, frontend, frontend_connection_params, countdown.remaining())
-    process = get_process("(oarstat -sj %(oar_job_id)i | grep 'Running\|Terminated\|Error') > /dev/null 2>&1 && oarstat -pj %(oar_job_id)i | oarprint host -f -" % {'oar_job_id': oar_job_id},
-                          host = get_frontend_host(frontend),
-                          connection_params = make_connection_params(frontend_connection_params,
-                                                                     default_frontend_connection_params))
+    process = _get_frontend_process("(oarstat -sj %(oar_job_id)i | grep 'Running\|Terminated\|Error') > /dev/null 2>&1 && oarstat -pj %(oar_job_id)i | oarprint host -f -" % {'oar_job_id': oar_job_id},
+                                    frontend = frontend,
+                                    connection_params = make_connection_params(frontend_connection_params,
+                                                                               default_frontend_connection_params))
     process.timeout = countdown.remaining()
     process.pty = True
     process.run()
     if process.ok:
-        host_addresses = re.findall("(\S+)", process.stdout, re.MULTILINE)
+        host_addresses = process.stdout.split()
         return [ Host(host_address) for host_address in host_addresses ]
     else:
         raise ProcessesFailed([process])
@@ -615,15 +817,15 @@ def get_oar_job_subnets(oar_job_id = None, frontend = None, frontend_connection_
         timeout = g5k_configuration.get('default_timeout')
     if oar_job_id == None:
         if 'OAR_JOB_ID' in os.environ:
-            oar_job_id = os.environ['OAR_JOB_ID']
+            oar_job_id = int(os.environ['OAR_JOB_ID'])
         else:
             raise ValueError("no oar job id given and no OAR_JOB_ID environment variable found")
     countdown = Timer(timeout)
     wait_oar_job_start(oar_job_id, frontend, frontend_connection_params, countdown.remaining())
     # Get ip adresses
-    process_ip = get_process(
+    process_ip = _get_frontend_process(
         "(oarstat -sj %(oar_job_id)i | grep 'Running\|Terminated\|Error') > /dev/null 2>&1 && g5k-subnets -i -m -j %(oar_job_id)i" % {'oar_job_id': oar_job_id},
-        host = get_frontend_host(frontend),
+        frontend = frontend,
         connection_params = make_connection_params(
             frontend_connection_params,
             default_frontend_connection_params))
@@ -631,9 +833,9 @@ def get_oar_job_subnets(oar_job_id = None, frontend = None, frontend_connection_
     process_ip.pty = True
     process_ip.run()
     # Get network parameters
-    process_net = get_process(
+    process_net = _get_frontend_process(
         "(oarstat -sj %(oar_job_id)i | grep 'Running\|Terminated\|Error') > /dev/null 2>&1 && g5k-subnets -a -j %(oar_job_id)i" % {'oar_job_id': oar_job_id},
-        host = get_frontend_host(frontend),
+        frontend = frontend,
         connection_params = make_connection_params(
             frontend_connection_params,
             default_frontend_connection_params))
@@ -642,7 +844,8 @@ def get_oar_job_subnets(oar_job_id = None, frontend = None, frontend_connection_
     process_net.run()
 
     if process_net.ok and process_ip.ok:
-        subnet_addresses = re.findall("(\S+)\s+(\S+)", process_ip.stdout, re.MULTILINE)
+        ip_mac = process_ip.stdout.split()
+        subnet_addresses = list(zip(ip_mac[0::2], ip_mac[1::2]))
         process_net_out = process_net.stdout.rstrip().split('\t')
         network_params = dict()
         if len(process_net_out) == 7:
@@ -681,14 +884,14 @@ def get_oar_job_kavlan(oar_job_id = None, frontend = None, frontend_connection_p
         timeout = g5k_configuration.get('default_timeout')
     if oar_job_id == None:
         if 'OAR_JOB_ID' in os.environ:
-            oar_job_id = os.environ['OAR_JOB_ID']
+            oar_job_id = int(os.environ['OAR_JOB_ID'])
         else:
             raise ValueError("no oar job id given and no OAR_JOB_ID environment variable found")
     countdown = Timer(timeout)
     wait_oar_job_start(oar_job_id, frontend, frontend_connection_params, countdown.remaining())
-    process = get_process(
+    process = _get_frontend_process(
         'kavlan -j %s -V ' % oar_job_id,
-        host = get_frontend_host(frontend),
+        frontend = frontend,
         connection_params = make_connection_params(
             frontend_connection_params,
             default_frontend_connection_params))
@@ -20,11 +20,12 @@ from .config import g5k_configuration
 from execo.config import make_connection_params
 from execo.exception import ProcessesFailed
 from execo.host import Host
-from execo.process import get_process
 from execo.time_utils import get_unixts, sleep
 from execo_g5k.config import default_frontend_connection_params
-from execo_g5k.utils import get_frontend_host
+from execo_g5k.utils import _get_frontend_process
 from .oar import format_oar_date, format_oar_duration, _date_in_range, \
+    _get_batch_commandline, _split_batch_output, \
+    _get_cached_job_infos, _set_cached_job_info, \
     oar_date_to_unixts, oar_duration_to_seconds
 from .api_utils import get_g5k_sites, get_cluster_site
 import os
@@ -33,43 +34,44 @@ import re
 def _quote_hack(rdef):
     return rdef.replace('{', '{\\\\\\\\\\\\\\"').replace('}', '\\\\\\\\\\\\\\"}')
 
+_oargridsub_job_id_re = re.compile("^\[OAR_GRIDSUB\] Grid reservation id = (\d+)\s*$", re.MULTILINE)
+_oargridsub_ssh_key_re = re.compile("^\[OAR_GRIDSUB\] SSH KEY : (\S*)\s*$", re.MULTILINE)
+
 def get_oargridsub_commandline(job_specs, reservation_date = None,
                                walltime = None, job_type = None,
                                queue = None, directory = None,
                                additional_options = None):
-    oargridsub_cmdline = 'oargridsub -v'
+    oargridsub_cmdline = [ 'oargridsub -v' ]
     key = g5k_configuration.get('oar_job_key_file')
     if key == None:
         key = os.environ.get('OAR_JOB_KEY_FILE')
     if key != None:
-        oargridsub_cmdline += ' -i %s' % (key,)
+        oargridsub_cmdline.append('-i %s' % (key,))
     if reservation_date:
-        oargridsub_cmdline += ' -s "%s"' % (format_oar_date(reservation_date),)
+        oargridsub_cmdline.append('-s "%s"' % (format_oar_date(reservation_date),))
     if queue != None:
-        oargridsub_cmdline += ' -q "%s"' % (queue,)
+        oargridsub_cmdline.append('-q "%s"' % (queue,))
     if job_type != None:
-        oargridsub_cmdline += ' -t "%s"' % (job_type,)
+        oargridsub_cmdline.append('-t "%s"' % (job_type,))
     if walltime != None:
-        oargridsub_cmdline += ' -w "%s"' % (format_oar_duration(walltime),)
+        oargridsub_cmdline.append('-w "%s"' % (format_oar_duration(walltime),))
     if directory != None:
-        oargridsub_cmdline += ' -d "%s"' % (directory,)
+        oargridsub_cmdline.append('-d "%s"' % (directory,))
     if additional_options != None:
-        oargridsub_cmdline += ' %s' % (additional_options,)
-    firstclusteralias = True
+        oargridsub_cmdline.append('%s' % (additional_options,))
+    rdefs = []
     for (spec, clusteralias) in job_specs:
-        if firstclusteralias:
-            firstclusteralias = False
-            oargridsub_cmdline += ' '
-        else:
-            oargridsub_cmdline += ','
-        oargridsub_cmdline += '%s:rdef="%s"' % (clusteralias, _quote_hack(spec.resources))
+        rdef = [ '%s:rdef="%s"' % (clusteralias, _quote_hack(spec.resources)) ]
         if spec.job_type != None:
-            oargridsub_cmdline += ':type="%s"' % (spec.job_type,)
+            rdef.append('type="%s"' % (spec.job_type,))
         if spec.sql_properties != None:
-            oargridsub_cmdline += ':prop="%s"' % (spec.sql_properties,)
+            rdef.append('prop="%s"' % (spec.sql_properties,))
         if spec.name != None:
-            oargridsub_cmdline += ':name="%s"' % (spec.name,)
-    return oargridsub_cmdline
+            rdef.append('name="%s"' % (spec.name,))
+        rdefs.append(':'.join(rdef))
+    if len(rdefs) > 0:
+        oargridsub_cmdline.append(','.join(rdefs))
+    return " ".join(oargridsub_cmdline)
 
 def oargridsub(job_specs, reservation_date = None,
                walltime = None, job_type = None,
@@ -125,20 +127,19 @@ def oargridsub(job_specs, reservation_date = None,
     oargridsub_cmdline = get_oargridsub_commandline(job_specs, reservation_date,
                                                     walltime, job_type, queue,
                                                     directory, additional_options)
-    process = get_process(oargridsub_cmdline,
-                          host = get_frontend_host(),
-                          connection_params = make_connection_params(frontend_connection_params,
-                                                                     default_frontend_connection_params))
+    process = _get_frontend_process(oargridsub_cmdline,
+                                    connection_params = make_connection_params(frontend_connection_params,
+                                                                               default_frontend_connection_params))
     process.timeout = timeout
-    process.pty = True
+    process.pty = False
     process.run()
     job_id = None
     ssh_key = None
     if process.ok:
-        mo = re.search("^\[OAR_GRIDSUB\] Grid reservation id = (\d+)\s*$", process.stdout, re.MULTILINE)
+        mo = _oargridsub_job_id_re.search(process.stdout)
         if mo != None:
             job_id = int(mo.group(1))
-        mo = re.search("^\[OAR_GRIDSUB\] SSH KEY : (\S*)\s*$", process.stdout, re.MULTILINE)
+        mo = _oargridsub_ssh_key_re.search(process.stdout)
         if mo != None:
             ssh_key = mo.group(1)
     if job_id != None:
@@ -165,18 +166,20 @@ def oargriddel(job_ids, frontend_connection_params = None, timeout = False):
     """
     if isinstance(timeout, bool) and timeout == False:
         timeout = g5k_configuration.get('default_timeout')
-    processes = []
-    for job_id in job_ids:
-        p = get_process("oargriddel %i" % (job_id,),
-                        host = get_frontend_host(),
-                        connection_params = make_connection_params(frontend_connection_params,
-                                                                   default_frontend_connection_params))
-        p.timeout = timeout
-        p.nolog_exit_code = True
-        p.pty = True
-        processes.append(p)
-    for process in processes: process.start()
-    for process in processes: process.wait()
+    job_ids = list(job_ids)
+    if len(job_ids) == 0:
+        return
+    # all deletions in a single command line, through a single
+    # connection
+    process = _get_frontend_process("; ".join([ "oargriddel %i" % (job_id,) for job_id in job_ids ]),
+                                    connection_params = make_connection_params(frontend_connection_params,
+                                                                               default_frontend_connection_params))
+    process.timeout = timeout
+    process.nolog_exit_code = True
+    process.pty = False
+    process.run()
+
+_oargridstat_job_id_re = re.compile("Reservation # (\d+):", re.MULTILINE)
 
 def get_current_oargrid_jobs(start_between = None,
                              end_between = None,
@@ -204,20 +207,21 @@ def get_current_oargrid_jobs(start_between = None,
         timeout = g5k_configuration.get('default_timeout')
     if start_between: start_between = [ get_unixts(t) for t in start_between ]
     if end_between: end_between = [ get_unixts(t) for t in end_between ]
-    process = get_process("oargridstat",
-                          host = get_frontend_host(),
-                          connection_params = make_connection_params(frontend_connection_params,
-                                                                     default_frontend_connection_params))
+    actual_connection_params = make_connection_params(frontend_connection_params,
+                                                      default_frontend_connection_params)
+    process = _get_frontend_process("oargridstat",
+                                    connection_params = actual_connection_params)
     process.timeout = timeout
     process.pty = True
     process.run()
     if process.ok:
-        jobs = re.findall("Reservation # (\d+):", process.stdout, re.MULTILINE)
+        jobs = _oargridstat_job_id_re.findall(process.stdout)
         oargrid_job_ids = [ int(j) for j in jobs ]
         if start_between or end_between:
             filtered_job_ids = []
-            for job in oargrid_job_ids:
-                info = get_oargrid_job_info(job, timeout)
+            for job, info in zip(oargrid_job_ids, _get_oargrid_jobs_infos(oargrid_job_ids,
+                                                                            actual_connection_params,
+                                                                            timeout)):
                 if (_date_in_range(info['start_date'], start_between)
                     and _date_in_range(info['start_date'] + info['walltime'], end_between)):
                     filtered_job_ids.append(job)
@@ -226,6 +230,29 @@ def get_current_oargrid_jobs(start_between = None,
     else:
         raise ProcessesFailed([process])
 
+_oargridstat_job_info_re = re.compile("start date : (?P<start_date>\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d)"
+                                      "|walltime : (?P<walltime>\d+:\d?\d:\d?\d)"
+                                      "|user : (?P<user>\S+)", re.MULTILINE)
+
+def _get_oargrid_job_info_cmdline(oargrid_job_id):
+    return "oargridstat %i" % (oargrid_job_id,)
+
+def _parse_oargrid_job_info(output):
+    job_info = dict()
+    # single pass on oargridstat output, keeping the first occurence
+    # of each field
+    for mo in _oargridstat_job_info_re.finditer(output):
+        field = mo.lastgroup
+        if field in job_info: continue
+        value = mo.group(field)
+        if field == 'start_date':
+            job_info[field] = oar_date_to_unixts(value)
+        elif field == 'walltime':
+            job_info[field] = oar_duration_to_seconds(value)
+        else:
+            job_info[field] = value
+    return job_info
+
 def get_oargrid_job_info(oargrid_job_id = None, frontend_connection_params = None, timeout = False):
     """Return a dict with informations about an oargrid job.
 
@@ -250,28 +277,45 @@ def get_oargrid_job_info(oargrid_job_id = None, frontend_connection_params = Non
     """
     if isinstance(timeout, bool) and timeout == False:
         timeout = g5k_configuration.get('default_timeout')
-    process = get_process("oargridstat %i" % (oargrid_job_id,),
-                          host = get_frontend_host(),
-                          connection_params = make_connection_params(frontend_connection_params,
-                                                                     default_frontend_connection_params))
+    job_info = _get_cached_job_infos([ ('oargrid', oargrid_job_id) ])[0]
+    if job_info != None:
+        return job_info
+    process = _get_frontend_process(_get_oargrid_job_info_cmdline(oargrid_job_id),
+                                    connection_params = make_connection_params(frontend_connection_params,
+                                                                               default_frontend_connection_params))
     process.timeout = timeout
     process.pty = True
     process.run()
-    job_info = dict()
-    start_date_result = re.search("start date : (\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d)", process.stdout, re.MULTILINE)
-    if start_date_result:
-        start_date = oar_date_to_unixts(start_date_result.group(1))
-        job_info['start_date'] = start_date
-    walltime_result = re.search("walltime : (\d+:\d?\d:\d?\d)", process.stdout, re.MULTILINE)
-    if walltime_result:
-        walltime = oar_duration_to_seconds(walltime_result.group(1))
-        job_info['walltime'] = walltime
-    user_result = re.search("user : (\S+)", process.stdout, re.MULTILINE)
-    if user_result:
-        user = user_result.group(1)
-        job_info['user'] = user
+    job_info = _parse_oargrid_job_info(process.stdout)
+    _set_cached_job_info(('oargrid', oargrid_job_id), job_info)
     return job_info
 
+def _get_oargrid_jobs_infos(oargrid_job_ids, frontend_connection_params, timeout):
+    # same as get_oargrid_job_info, but for a list of oargrid job ids,
+    # returns the list of their infos. Uses only one process, running
+    # all the oargridstat in a batch. Jobs whose infos are in the
+    # cache are not queried.
+    infos = _get_cached_job_infos([ ('oargrid', job_id) for job_id in oargrid_job_ids ])
+    cmdlines = [ (index, _get_oargrid_job_info_cmdline(job_id))
+                 for (index, job_id) in enumerate(oargrid_job_ids)
+                 if infos[index] == None ]
+    if len(cmdlines) == 0:
+        return infos
+    process = _get_frontend_process(_get_batch_commandline(cmdlines),
+                                    connection_params = make_connection_params(frontend_connection_params,
+                                                                               default_frontend_connection_params))
+    process.timeout = timeout
+    process.pty = True
+    process.run()
+    outputs = _split_batch_output(process.stdout)
+    for index, job_id in enumerate(oargrid_job_ids):
+        if infos[index] == None:
+            infos[index] = _parse_oargrid_job_info(outputs.get(index, (None, ""))[1])
+            _set_cached_job_info(('oargrid', job_id), infos[index])
+    return infos
+
+_oargridstat_oar_jobs_re = re.compile("^\t(\w+) --> (\d+)", re.MULTILINE)
+
 def get_oargrid_job_oar_jobs(oargrid_job_id = None, frontend_connection_params = None, timeout = False):
     """Return a list of tuples (oar job id, site), the list of individual oar jobs which make an oargrid job.
 
@@ -288,16 +332,15 @@ def get_oargrid_job_oar_jobs(oargrid_job_id = None, frontend_connection_params =
     """
     if isinstance(timeout, bool) and timeout == False:
         timeout = g5k_configuration.get('default_timeout')
-    process = get_process("oargridstat %i" % (oargrid_job_id,),
-                          host = get_frontend_host(),
-                          connection_params = make_connection_params(frontend_connection_params,
-                                                                     default_frontend_connection_params))
+    process = _get_frontend_process(_get_oargrid_job_info_cmdline(oargrid_job_id),
+                                    connection_params = make_connection_params(frontend_connection_params,
+                                                                               default_frontend_connection_params))
     process.timeout = timeout
     process.pty = True
     process.run()
     if process.ok:
         job_specs = []
-        for m in re.finditer("^\t(\w+) --> (\d+)", process.stdout, re.MULTILINE):
+        for m in _oargridstat_oar_jobs_re.finditer(process.stdout):
             site = m.group(1)
             if site not in get_g5k_sites():
                 site = get_cluster_site(site)
@@ -338,15 +381,14 @@ def get_oargrid_job_nodes(oargrid_job_id, frontend_connection_params = None, tim
     """
     if isinstance(timeout, bool) and timeout == False:
         timeout = g5k_configuration.get('default_timeout')
-    process = get_process("oargridstat -wl %i 2>/dev/null || oargridstat -l %i 2>/dev/null" % (oargrid_job_id, oargrid_job_id),
-                          host = get_frontend_host(),
-                          connection_params = make_connection_params(frontend_connection_params,
-                                                                     default_frontend_connection_params))
+    process = _get_frontend_process("oargridstat -wl %i 2>/dev/null || oargridstat -l %i 2>/dev/null" % (oargrid_job_id, oargrid_job_id),
+                                    connection_params = make_connection_params(frontend_connection_params,
+                                                                               default_frontend_connection_params))
     process.timeout = timeout
     process.pty = True
     process.run()
     if process.ok:
-        host_addresses = re.findall("(\S+)", process.stdout, re.MULTILINE)
+        host_addresses = process.stdout.split()
         return list(set([ Host(host_address) for host_address in host_addresses ]))
     else:
         raise ProcessesFailed([process])
@@ -25,8 +25,9 @@ from execo import logger, Host
 from execo.log import style
 from execo.time_utils import timedelta_to_seconds, get_seconds, \
     unixts_to_datetime, get_unixts, format_date
-from execo_g5k import OarSubmission, get_current_oar_jobs, get_oar_job_info, \
+from execo_g5k import OarSubmission, get_current_oar_jobs, \
     get_current_oargrid_jobs, get_oargrid_job_oar_jobs
+from execo_g5k.oar import get_oar_jobs_infos
 from execo_g5k.api_utils import get_g5k_sites, get_g5k_clusters, \
     get_cluster_site, get_site_clusters, get_resource_attributes, get_host_cluster, \
     get_host_site, get_host_attributes, get_g5k_hosts, get_host_shortname, \
@@ -62,14 +63,12 @@ def get_job_by_name(job_name, sites=None):
     oargrid_jobs = get_current_oargrid_jobs()
     if len(oargrid_jobs) > 0:
         for g_job in oargrid_jobs:
-            for job in get_oargrid_job_oar_jobs(g_job):
-                info = get_oar_job_info(job[0], job[1])
+            for info in get_oar_jobs_infos(get_oargrid_job_oar_jobs(g_job)):
                 if info['name'] == job_name:
                     logger.info('Oargridjob %s found !', style.emph(g_job))
                     return g_job, None
     running_jobs = get_current_oar_jobs(sites)
-    for job in running_jobs:
-        info = get_oar_job_info(job[0], job[1])
+    for job, info in zip(running_jobs, get_oar_jobs_infos(running_jobs)):
         if info['name'] == job_name:
             logger.info('Job %s found on site %s !', style.emph(job[0]),
                         style.host(job[1]))
@@ -22,19 +22,19 @@ from execo.log import style
 from execo.host import Host
 from execo_g5k.config import g5k_configuration, default_frontend_connection_params
 from execo_g5k.api_utils import get_resource_attributes, get_host_cluster,\
-    get_host_attributes, get_host_shortname
-from execo.process import PortForwarder
+    get_host_attributes
+from execo.process import PortForwarder, get_process
 import re
 import socket
 import copy
-import argparse
-import time
 from random import randint
 
 frontend_factory = ActionFactory(remote_tool = SSH,
                                  fileput_tool = SCP,
                                  fileget_tool = SCP)
 
+_host_site_re = re.compile("^[^ \t\n\r\f\v\.]+\.([^ \t\n\r\f\v\.]+)\.grid5000.fr$")
+
 __default_frontend = None
 __default_frontend_cached = False
 def get_default_frontend():
@@ -49,7 +49,7 @@ def get_default_frontend():
                 localhost = socket.gethostname()
             except socket.error:
                 localhost = ""
-            mo = re.search("^[^ \t\n\r\f\v\.]+\.([^ \t\n\r\f\v\.]+)\.grid5000.fr$", localhost)
+            mo = _host_site_re.search(localhost)
             if mo:
                 __default_frontend = mo.group(1)
             else:
@@ -66,6 +66,17 @@ def get_frontend_host(frontend = None):
         frontend = Host(frontend)
     return frontend
 
+def _get_frontend_process(cmd, frontend = None, connection_params = None):
+    # return a process running cmd on the given frontend (or the
+    # default frontend if None), through ssh, or locally if
+    # get_frontend_host says so. Frontend command lines are written
+    # for the remote shell run by ssh, so local processes run them in
+    # a shell too.
+    host = get_frontend_host(frontend)
+    process = get_process(cmd, host = host, connection_params = connection_params)
+    process.shell = (host == None)
+    return process
+
 def get_kavlan_host_name(host, vlanid):
     """Returns the DNS hostname of a host once switched in a kavlan."""
     if isinstance(host, Host):